@@ -4,13 +4,35 @@ import os
 import sys
 
 sys.path.insert(0, './pybtex/')
-from pybtex.database import parse_file
-from pybtex.database import BibliographyData, Entry
+from pybtex.database import BibliographyData, Entry, BibliographyDataError
+from pybtex.database.input.bibtex import Parser
+from pybtex.database.output.bibtex import Writer
+from pybtex.errors import report_error
+import pybtex.io
 
 import unidecode
 import argparse
 import csv
 import html
+import functools
+import mmap
+import collections
+import concurrent.futures
+import hashlib
+import pickle
+import sqlite3
+import time
+import re
+import zlib
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 mergedCont = 0 
 
@@ -47,6 +69,139 @@ def mergeEntry(original, novo):
 
     return original
 
+#=============================================================
+def iterBibChunks(buffer):
+    """
+    Split a bib buffer into the byte chunks of its top level @ commands.
+    A command ends at the brace or parenthesis closing the one it was opened
+    with, an @ inside it, also in a quoted value, does not start a new one
+
+    Attributes
+    ----------
+    buffer : bytes or mmap.mmap
+        The content of a bib file
+
+    Returns
+    -------
+    generator of (int, bytes)
+        The line the chunk starts in and the chunk, one per @entry, @string,
+        @preamble or @comment
+    """
+    # outside a command only @ counts, in its head up to the opening
+    # delimiter only @, { and (
+    outside, head, body = 0, 1, 2
+    state = outside
+    closing = None
+    depth = 0
+    quoted = False
+    start = None
+    line = 1
+    counted = 0
+    for match in re.finditer(rb'[{}()"@]', buffer):
+        char = match.group()
+        if state == body:
+            if char == b'{':
+                depth = depth + 1
+            elif char == b'}':
+                depth = depth - 1
+                if depth == 0 and closing == b'}':
+                    state = outside
+            elif char == b'"':
+                # quotes delimit values only at the level of the fields
+                if depth == (1 if closing == b'}' else 0):
+                    quoted = not quoted
+            elif char == b')':
+                if depth == 0 and closing == b')' and not quoted:
+                    state = outside
+        elif char == b'@':
+            if start is not None:
+                yield line, buffer[start:match.start()]
+            line = line + buffer[counted:match.start()].count(b'\n')
+            counted = start = match.start()
+            state = head
+        elif state == head and char in (b'{', b'('):
+            closing = b'}' if char == b'{' else b')'
+            depth = 1 if char == b'{' else 0
+            quoted = False
+            state = body
+    if start is not None:
+        yield line, buffer[start:]
+
+class ChunkParser(Parser):
+    """
+    pybtex Parser for the chunks of iterBibChunks, the line numbers in its
+    errors count from the start of the file instead of the chunk
+
+    Attributes
+    ----------
+    lineOffset : int
+        The number of lines in the file before the current chunk
+    """
+    lineOffset = 0
+
+    def handle_error(self, error):
+        # strict mode raises the error again through the enclosing handlers
+        if getattr(error, 'lineno', None) is not None and not getattr(error, 'inFile', False):
+            error.lineno = error.lineno + self.lineOffset
+            error.inFile = True
+        super().handle_error(error)
+
+def iterBibEntries(buffer, fileName="<INPUT>", encoding=None):
+    """
+    Parse a bib buffer entry by entry instead of building the whole BibliographyData
+
+    Attributes
+    ----------
+    buffer : bytes or mmap.mmap
+        The content of a bib file
+    fileName : str, optional
+        The file name used in error messages (default is "<INPUT>")
+    encoding : str, optional
+        The encoding of the buffer (default is the pybtex default encoding)
+
+    Returns
+    -------
+    generator of pybtex.database.Entry
+        The entries in file order
+    """
+    encoding = encoding or pybtex.io.get_default_encoding()
+    parser = ChunkParser(encoding=encoding)
+    parser.filename = fileName
+    seenKeys = set()
+    for line, chunk in iterBibChunks(buffer):
+        # @string macros are kept in parser.macros across chunks
+        parser.data = BibliographyData()
+        parser.lineOffset = line - 1
+        parser.parse_string(chunk.decode(encoding))
+        for entry in parser.data.entries.values():
+            if entry.key.lower() in seenKeys:
+                report_error(BibliographyDataError(f"repeated bibliography entry: {entry.key}"))
+                continue
+            seenKeys.add(entry.key.lower())
+            yield entry
+
+def iterBibFile(filePath, encoding=None):
+    """
+    Parse a bib file entry by entry from a memory mapped buffer
+
+    Attributes
+    ----------
+    filePath : str
+        The path of the bib file
+    encoding : str, optional
+        The encoding of the file (default is the pybtex default encoding)
+
+    Returns
+    -------
+    generator of pybtex.database.Entry
+        The entries in file order
+    """
+    with open(filePath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield from iterBibEntries(buffer, filePath, encoding)
+
 #=============================================================
 def getEntryDOIStr(entry):
     doi = ''
@@ -106,163 +261,952 @@ def getEntryAbstractStr(entry):
         abstract = html.unescape(abstract).replace('\\%','%')
     return abstract
 
+cleanStringTable = str.maketrans('', '', " .,-:/\\'`")
+
 def cleanStringToCompare(xStr):
-    return xStr.lower().replace(' ','').replace('.','').replace(',','').replace('-','').replace(':','').replace('/','').replace('\\','').replace("'",'').replace('`','')
+    return xStr.lower().translate(cleanStringTable)
+
+@functools.lru_cache(maxsize=None)
+def foldName(name):
+    return unidecode.unidecode(name).lower()
+
+def getEntryFirstAuthorNames(entry):
+    try:
+        lastname = foldName(entry.persons['author'][0].last_names[0])
+    except :
+        lastname = ""
+
+    # pybtex persons have no firstNames attribute, so firstName stays empty
+    # as it always did in the year tolerance rule
+    try:
+        firstName = foldName(entry.persons['author'][0].firstNames[0])
+    except :
+        firstName = ""
+
+    return lastname, firstName
+
+def getEntryKeys(entry):
+    """
+    Get the keys run needs for an entry, computed once per entry
+
+    Returns
+    -------
+    tuple
+        doi, author, year, title, publish, the normalized title and the
+        ASCII folded (lastname, firstName) of the first author
+    """
+    title = getEntryTitleStr(entry)
+    return (getEntryDOIStr(entry), getEntryAuthorStr(entry), getEntryYearStr(entry), title, getEntryPublishStr(entry),
+            cleanStringToCompare(title), getEntryFirstAuthorNames(entry))
+
+def parseBibFile(filePath):
+    """
+    Parse a bib file and extract the keys run needs for every entry,
+    used as process pool task by iterBibFileList
+
+    Returns
+    -------
+    list of (pybtex.database.Entry, tuple)
+        The entries in file order with their keys from getEntryKeys
+    """
+    return [(entry, getEntryKeys(entry)) for entry in iterBibFile(filePath)]
+
+def iterEntryKeys(entries, timings):
+    """
+    Yield (entry, getEntryKeys(entry)) and add the seconds spent reading and
+    extracting to timings['parse'] and timings['extract']
+    """
+    entries = iter(entries)
+    while True:
+        startTime = time.perf_counter()
+        entry = next(entries, None)
+        parseTime = time.perf_counter()
+        timings['parse'] = timings['parse'] + parseTime - startTime
+        if entry is None:
+            return
+        keys = getEntryKeys(entry)
+        timings['extract'] = timings['extract'] + time.perf_counter() - parseTime
+        yield entry, keys
+
+def iterBibFileList(folderPath, fileList, workers=1, parsedFileCache=None, timings=None):
+    """
+    Parse the bib files of fileList, in a process pool if workers > 1
+
+    Attributes
+    ----------
+    folderPath : str
+        The folder of the bib files
+    fileList : list of str
+        The bib file names
+    workers : int, optional
+        The number of processes parsing files in parallel (default is 1)
+    parsedFileCache : ParsedFileCache, optional
+        Load unchanged files from and store parsed files in this cache
+        (default is None)
+    timings : dict, optional
+        Seconds are added to its 'parse' and 'extract' items. Cache access and
+        waiting for the process pool count as 'parse' (default is None)
+
+    Returns
+    -------
+    generator of (str, iterable of (pybtex.database.Entry, tuple))
+        The file name and its entries with keys, always in fileList order
+    """
+    if timings is None:
+        timings = {'parse': 0.0, 'extract': 0.0}
+
+    if workers <= 1:
+        for bibFileName in fileList:
+            filePath = os.path.join(folderPath, bibFileName)
+            if parsedFileCache is None:
+                yield bibFileName, iterEntryKeys(iterBibFile(filePath), timings)
+                continue
+
+            startTime = time.perf_counter()
+            entries = parsedFileCache.load(filePath)
+            timings['parse'] = timings['parse'] + time.perf_counter() - startTime
+            if entries is None:
+                entries = list(iterEntryKeys(iterBibFile(filePath), timings))
+                startTime = time.perf_counter()
+                parsedFileCache.store(filePath, entries)
+                timings['parse'] = timings['parse'] + time.perf_counter() - startTime
+            yield bibFileName, entries
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(bibFileName):
+            filePath = os.path.join(folderPath, bibFileName)
+            if parsedFileCache is not None:
+                entries = parsedFileCache.load(filePath)
+                if entries is not None:
+                    future = concurrent.futures.Future()
+                    future.set_result(entries)
+                    return bibFileName, filePath, future, True
+            return bibFileName, filePath, pool.submit(parseBibFile, filePath), False
+
+        # bound the parsed files waiting for the merge to keep memory low
+        pending = collections.deque()
+        files = iter(fileList)
+        for bibFileName in files:
+            pending.append(submit(bibFileName))
+            if len(pending) >= 2*workers:
+                break
+        while pending:
+            startTime = time.perf_counter()
+            bibFileName, filePath, future, cached = pending.popleft()
+            nextFileName = next(files, None)
+            if nextFileName is not None:
+                pending.append(submit(nextFileName))
+            entries = future.result()
+            if parsedFileCache is not None and not cached:
+                parsedFileCache.store(filePath, entries)
+            timings['parse'] = timings['parse'] + time.perf_counter() - startTime
+            yield bibFileName, entries
+
+def isSameFirstAuthor(firstAuthor, firstAuthorOut):
+    lastname, firstName = firstAuthor
+    lastNameOut, firstNameOut = firstAuthorOut
+    return (lastname==lastNameOut or lastname==firstNameOut or lastNameOut==firstName)
+
+def getTitleShingles(title, size=3):
+    title = unidecode.unidecode(html.unescape(title)).lower()
+    title = ' '.join(re.sub(r'[^a-z0-9]+', ' ', title).split())
+    if len(title) <= size:
+        return {title}
+    return {title[i:i+size] for i in range(len(title)-size+1)}
+
+subtitleSeparator = re.compile(r'\s*[:?!]\s+|\s+[-\u2013\u2014]+\s+')
+
+def getMainTitleShingles(title, minLength=20):
+    """
+    Get the shingles of the title without its subtitle, the text before the
+    first ': ', '? ', '! ' or ' - ', None if there is no subtitle or the
+    main title is shorter than minLength characters
+    """
+    title = html.unescape(title)
+    match = subtitleSeparator.search(title)
+    if match is None or match.start() < minLength:
+        return None
+    return getTitleShingles(title[:match.start()])
 
 
 #=============================================================
-def run(folderPath, fileList, fileNameOut, logProcess):
+class MinHashIndex:
+    """
+    Locality-sensitive hashing over MinHash signatures of title shingles.
+
+    Two titles are compared as a whole and, so that a title with an added
+    subtitle still matches, each title also against the other one's main
+    title without subtitle. Main titles are not compared with each other,
+    papers of a series often share them.
+
+    Attributes
+    ----------
+    threshold : float
+        The minimal Jaccard similarity of the title shingles for two entries
+        to be near duplicates
+    numPerm : int, optional
+        The number of hash permutations in a signature (default is 128)
+    """
+
+    prime = (1 << 31) - 1
+
+    def __init__(self, threshold, numPerm=128):
+        self.threshold = threshold
+        self.bands, self.rows = getLSHBands(threshold, numPerm)
+
+        rng = np.random.RandomState(1)
+        self.a = rng.randint(1, self.prime, size=(self.bands*self.rows, 1)).astype(np.int64)
+        self.b = rng.randint(0, self.prime, size=(self.bands*self.rows, 1)).astype(np.int64)
+
+        self.buckets = {}
+        self.shingles = {}
+        # id(entry) -> (entry, shingles, mainShingles, bandKeys), kept across
+        # clear so that MergeIndex.rebuild does not recompute signatures
+        self.cache = {}
+
+    def clear(self):
+        self.buckets = {}
+        self.shingles = {}
+
+    def signature(self, shingles):
+        hashes = np.array([zlib.crc32(s.encode('utf-8')) % self.prime for s in shingles], dtype=np.int64)
+        return ((self.a * hashes + self.b) % self.prime).min(axis=1)
+
+    def bandKeys(self, shingles, mainShingles=None):
+        """
+        The LSH buckets of the title, and of its main title if it has a subtitle
+        """
+        bandKeys = []
+        for titleShingles in (shingles, mainShingles):
+            if titleShingles is not None:
+                signature = self.signature(titleShingles)
+                bandKeys.extend((i, signature[i*self.rows:(i+1)*self.rows].tobytes()) for i in range(self.bands))
+        return set(bandKeys)
+
+    def similarity(self, shingles, mainShingles, shinglesOut, mainShinglesOut):
+        """
+        The highest Jaccard similarity of the titles or of one title and the
+        other's main title
+        """
+        pairs = [(shingles, shinglesOut), (shingles, mainShinglesOut), (mainShingles, shinglesOut)]
+        return max(len(a & b) / len(a | b) for a, b in pairs if a is not None and b is not None)
+
+    def add(self, position, entry, firstAuthor):
+        if id(entry) not in self.cache:
+            title = getEntryTitleStr(entry)
+            shingles = getTitleShingles(title)
+            mainShingles = getMainTitleShingles(title)
+            self.cache[id(entry)] = (entry, shingles, mainShingles, self.bandKeys(shingles, mainShingles))
+        _, shingles, mainShingles, bandKeys = self.cache[id(entry)]
+
+        self.shingles[position] = (shingles, mainShingles)
+        for bandKey in bandKeys:
+            self.buckets.setdefault(bandKey, []).append((position, entry, firstAuthor))
+
+    def find(self, entry, title, firstAuthor):
+        """
+        Return the earliest accepted entry whose title is similar enough and
+        that passes the year and first author rules of run, None otherwise
+        """
+        shingles = getTitleShingles(title)
+        mainShingles = getMainTitleShingles(title)
+        candidates = {}
+        for bandKey in self.bandKeys(shingles, mainShingles):
+            for position, entryOut, firstAuthorOut in self.buckets.get(bandKey, ()):
+                candidates[position] = (entryOut, firstAuthorOut)
+
+        year = int(str(entry.fields['year']))
+        for position in sorted(candidates):
+            if self.similarity(shingles, mainShingles, *self.shingles[position]) < self.threshold:
+                continue
+
+            entryOut, firstAuthorOut = candidates[position]
+            diff = abs(year-int(str(entryOut.fields['year'])))
+            if (diff==0) or ((diff==1 or diff==2) and isSameFirstAuthor(firstAuthor, firstAuthorOut)):
+                return entryOut
+        return None
+
+def getLSHBands(threshold, numPerm):
+    """
+    Get the number of bands and rows per band so that the LSH threshold
+    (1/bands)^(1/rows) is as close as possible to, but not above, threshold
+    """
+    bands, rows = numPerm, 1
+    for r in range(1, numPerm+1):
+        b = numPerm // r
+        if (1/b)**(1/r) > threshold:
+            break
+        bands, rows = b, r
+    return bands, rows
+
+
+#=============================================================
+class MergeIndex:
+    """
+    DOI and normalized title indexes over the entries accepted by run.
+
+    Lookups return the same entry a linear scan over bibDataOut.entries
+    would find: the first entry matching by DOI or by title with a 1-2 year
+    difference and the same first author, otherwise the last entry with the
+    same title and year.
+
+    Attributes
+    ----------
+    similarityThreshold : float, optional
+        If set, titles are also indexed in a MinHashIndex to find near
+        duplicates with findNear (default is None)
+    """
+
+    def __init__(self, similarityThreshold=None):
+        self.doiIndex = {}
+        self.titleIndex = {}
+        self.position = {}
+        self.count = 0
+
+        self.similarityThreshold = similarityThreshold
+        self.minHashIndex = None
+        if similarityThreshold is not None:
+            self.minHashIndex = MinHashIndex(similarityThreshold)
+
+    def add(self, entry, cleanTitle=None, firstAuthor=None):
+        # an entry can occupy two slots after rebuild, the first one wins a DOI lookup
+        self.position.setdefault(id(entry), self.count)
+
+        doi = getEntryDOIStr(entry)
+        if doi != '':
+            self.doiIndex.setdefault(doi, entry)
+
+        if cleanTitle is None:
+            cleanTitle = cleanStringToCompare(getEntryTitleStr(entry))
+        if firstAuthor is None:
+            firstAuthor = getEntryFirstAuthorNames(entry)
+        self.titleIndex.setdefault(cleanTitle, []).append((self.count, entry, firstAuthor))
+        if self.minHashIndex is not None:
+            self.minHashIndex.add(self.count, entry, firstAuthor)
+        self.count = self.count + 1
+
+    def update(self, entry):
+        # mergeEntry may add a doi to an entry that had none
+        doi = getEntryDOIStr(entry)
+        if doi != '':
+            doiEntry = self.doiIndex.get(doi)
+            if doiEntry is None or self.position[id(entry)] < self.position[id(doiEntry)]:
+                self.doiIndex[doi] = entry
+
+    def rebuild(self, entries):
+        self.doiIndex = {}
+        self.titleIndex = {}
+        self.position = {}
+        self.count = 0
+        if self.minHashIndex is not None:
+            self.minHashIndex.clear()
+        for entry in entries:
+            self.add(entry)
+
+    def find(self, entry, doi, cleanTitle, firstAuthor):
+        doiEntry = None
+        doiPosition = None
+        if (doi != ''):
+            doiEntry = self.doiIndex.get(doi)
+            if doiEntry is not None:
+                doiPosition = self.position[id(doiEntry)]
+
+        oldEntry = None
+        year = int(str(entry.fields['year']))
+        for position, entryOut, firstAuthorOut in self.titleIndex.get(cleanTitle, ()):
+            if doiPosition is not None and position >= doiPosition:
+                break
+
+            yearOut = int(str(entryOut.fields['year']))
+            diff = abs(year-yearOut)
+            if (diff==0):
+                oldEntry = entryOut
+            elif (diff==1 or diff==2) and isSameFirstAuthor(firstAuthor, firstAuthorOut):
+                return entryOut
+
+        if doiEntry is not None:
+            return doiEntry
+        return oldEntry
+
+    def findNear(self, entry, title, firstAuthor):
+        if self.minHashIndex is None:
+            return None
+        return self.minHashIndex.find(entry, title, firstAuthor)
+
+
+#=============================================================
+def getFileHash(filePath):
+    h = hashlib.sha1()
+    with open(filePath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class ParsedFileCache:
+    """
+    SQLite cache of the entries and keys parseBibFile extracted from bib files.
+    A cached file is used while its size and mtime, or else its content hash,
+    are unchanged. Files that no longer exist are evicted when the cache opens.
+
+    Attributes
+    ----------
+    cachePath : str
+        The path of the SQLite database, created if it does not exist
+    """
+
+    # increase when getEntryKeys changes to drop entries cached by older versions
+    version = 2
+
+    def __init__(self, cachePath):
+        self.connection = sqlite3.connect(cachePath)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != self.version:
+            with self.connection:
+                self.connection.execute('DROP TABLE IF EXISTS parsed')
+                self.connection.execute(f'PRAGMA user_version = {self.version}')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS parsed (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT, data BLOB)')
+        self.evict()
+
+    def evict(self):
+        paths = [row[0] for row in self.connection.execute('SELECT path FROM parsed')]
+        with self.connection:
+            self.connection.executemany('DELETE FROM parsed WHERE path = ?', [(p,) for p in paths if not os.path.isfile(p)])
+
+    def load(self, filePath):
+        filePath = os.path.abspath(filePath)
+        row = self.connection.execute('SELECT size, mtime, hash, data FROM parsed WHERE path = ?', (filePath,)).fetchone()
+        if row is None:
+            return None
+
+        size, mtime, fileHash, data = row
+        stat = os.stat(filePath)
+        if (size != stat.st_size):
+            return None
+        if (mtime != stat.st_mtime_ns):
+            if (getFileHash(filePath) != fileHash):
+                return None
+            with self.connection:
+                self.connection.execute('UPDATE parsed SET mtime = ? WHERE path = ?', (stat.st_mtime_ns, filePath))
+
+        return pickle.loads(zlib.decompress(data))
+
+    def store(self, filePath, entries):
+        filePath = os.path.abspath(filePath)
+        stat = os.stat(filePath)
+        data = zlib.compress(pickle.dumps(entries, pickle.HIGHEST_PROTOCOL))
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?)',
+                (filePath, stat.st_size, stat.st_mtime_ns, getFileHash(filePath), data))
+
+    def close(self):
+        self.connection.close()
+
+class MergeStore:
+    """
+    SQLite store of the entries accepted by run, so new bib files can be
+    merged into a previous result without re-reading the old files. Each
+    entry is stored with its BibTeX, writeBib only renders the entries that
+    changed since
+
+    Attributes
+    ----------
+    storePath : str
+        The path of the SQLite database, created if it does not exist
+    """
+
+    def __init__(self, storePath):
+        self.connection = sqlite3.connect(storePath)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (hash TEXT PRIMARY KEY, name TEXT, entries INTEGER);
+            CREATE TABLE IF NOT EXISTS entries (position INTEGER PRIMARY KEY, key TEXT, objectId INTEGER, doi TEXT, cleanTitle TEXT, entry BLOB, bibtex TEXT);
+            CREATE INDEX IF NOT EXISTS entries_doi ON entries (doi);
+            CREATE INDEX IF NOT EXISTS entries_cleanTitle ON entries (cleanTitle);
+        ''')
+        # stores of older versions have no BibTeX, their entries are rendered once
+        if 'bibtex' not in [row[1] for row in self.connection.execute('PRAGMA table_info(entries)')]:
+            self.connection.execute('ALTER TABLE entries ADD COLUMN bibtex TEXT')
+        self.writer = Writer()
+        # key -> BibTeX of the entry under that key
+        self.texts = {}
+        self.rendered = set()
+        self.newFiles = {}
+        self.fileEntries = {}
+        self.dirty = {}
+        # id(entry) -> (entry, objectId), one entry object can fill several
+        # slots of bibDataOut.entries after a merge under a suffixed key
+        self.objectIds = {}
+        self.nextObjectId = 0
+
+    def load(self, bibDataOut, mergeIndex):
+        objects = {}
+        for key, objectId, blob, bibtex in self.connection.execute('SELECT key, objectId, entry, bibtex FROM entries ORDER BY position'):
+            if objectId not in objects:
+                objects[objectId] = pickle.loads(blob)
+            entry = objects[objectId]
+            if bibtex is not None:
+                self.texts[key] = bibtex
+            self.objectIds[id(entry)] = (entry, objectId)
+            self.nextObjectId = max(self.nextObjectId, objectId + 1)
+            bibDataOut.entries[key] = entry
+            mergeIndex.add(entry)
+
+    def getObjectId(self, entry):
+        if id(entry) not in self.objectIds:
+            self.objectIds[id(entry)] = (entry, self.nextObjectId)
+            self.nextObjectId = self.nextObjectId + 1
+        return self.objectIds[id(entry)][1]
+
+    def filterNewFiles(self, folderPath, fileList):
+        """
+        Return the files of fileList whose content was not merged before
+        """
+        knownHashes = {row[0] for row in self.connection.execute('SELECT hash FROM files')}
+        newFileList = []
+        for bibFileName in fileList:
+            fileHash = getFileHash(os.path.join(folderPath, bibFileName))
+            if fileHash in knownHashes:
+                print(bibFileName + ': already merged')
+                continue
+            knownHashes.add(fileHash)
+            self.newFiles[bibFileName] = fileHash
+            newFileList.append(bibFileName)
+        return newFileList
+
+    def addFile(self, bibFileName, entries):
+        self.fileEntries[bibFileName] = entries
+
+    def markDirty(self, entry):
+        self.dirty[id(entry)] = entry
+
+    def getBibtex(self, key, entry):
+        """
+        Get the BibTeX of entry under key as bibDataOut.to_file writes it,
+        rendered again only if the entry changed since it was stored
+        """
+        if key not in self.rendered and (id(entry) in self.dirty or key not in self.texts):
+            # BibliographyData(entries=...) would set entry.key to key
+            bibData = BibliographyData()
+            bibData.entries[key] = entry
+            self.texts[key] = self.writer.to_string(bibData)
+            self.rendered.add(key)
+        return self.texts[key]
+
+    def writeBib(self, bibDataOut, filePath):
+        """
+        Write bibDataOut to filePath like bibDataOut.to_file, from the stored
+        BibTeX of the unchanged entries
+        """
+        with pybtex.io.open_unicode(filePath, 'w', encoding=self.writer.encoding) as f:
+            f.write('\n'.join(self.getBibtex(key, entry) for key, entry in bibDataOut.entries.items()))
+
+    def save(self, bibDataOut):
+        with self.connection:
+            for position, (key, entry) in enumerate(bibDataOut.entries.items()):
+                if id(entry) in self.dirty or key in self.rendered:
+                    self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (position, key, self.getObjectId(entry), getEntryDOIStr(entry), cleanStringToCompare(getEntryTitleStr(entry)), pickle.dumps(entry),
+                         self.getBibtex(key, entry)))
+            for bibFileName, entries in self.fileEntries.items():
+                self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)',
+                    (self.newFiles[bibFileName], bibFileName, entries))
+        self.newFiles = {}
+        self.fileEntries = {}
+        self.dirty = {}
+        self.rendered = set()
+
+    def close(self):
+        self.connection.close()
+
+
+#=============================================================
+class BufferedCSVWriter:
+    """
+    Semicolon separated csv writer that collects rows and writes them in batches
+
+    Attributes
+    ----------
+    filePath : str
+        The path of the csv file
+    header : list of str
+        The first row of the file
+    batchSize : int, optional
+        The number of rows collected before they are written (default is 10000)
+    append : bool, optional
+        Append to an existing file, the header is only written to a new or
+        empty file (default is False)
+    """
+
+    def __init__(self, filePath, header, batchSize=10000, append=False):
+        self.file = open(filePath, 'a' if append else 'w', encoding='utf-8', buffering=1 << 20)
+        self.writer = csv.writer(self.file, delimiter=';', quotechar='"')
+        if self.file.tell() == 0:
+            self.writer.writerow(header)
+        self.batchSize = batchSize
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batchSize:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        self.writer.writerows(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def getEntryExportKeys(entry, exportKeys):
+    """
+    Get doi, author, year, title and publish of an accepted entry, reusing the
+    keys extracted during the merge unless the entry was merged since
+    """
+    if id(entry) in exportKeys:
+        return exportKeys[id(entry)][1]
+    return getEntryDOIStr(entry), getEntryAuthorStr(entry), getEntryYearStr(entry), getEntryTitleStr(entry), getEntryPublishStr(entry)
+
+def writeColumnar(filePath, header, rows):
+    """
+    Write rows column by column for fast loading in the screening notebooks
+
+    Attributes
+    ----------
+    filePath : str
+        The output path. Ending in .parquet or .arrow it needs pyarrow, ending
+        in .npz it is written with numpy. Without one of these extensions
+        .parquet is appended if pyarrow is installed, .npz otherwise.
+    header : list of str
+        The column names
+    rows : list of list
+        The rows, int columns are kept as int64, all others are strings
+
+    Returns
+    -------
+    str
+        The path of the written file
+    """
+    if not filePath.endswith(('.parquet', '.arrow', '.npz')):
+        filePath = filePath + ('.parquet' if pyarrow is not None else '.npz')
+
+    columns = {}
+    for i, name in enumerate(header):
+        values = [row[i] for row in rows]
+        if not all(type(value) == int for value in values):
+            values = [str(value) for value in values]
+        columns[name] = values
+
+    if filePath.endswith('.parquet'):
+        pyarrow.parquet.write_table(pyarrow.table(columns), filePath)
+    elif filePath.endswith('.arrow'):
+        pyarrow.feather.write_feather(pyarrow.table(columns), filePath)
+    else:
+        # strings are stored as one utf-8 buffer plus offsets per column
+        arrays = {}
+        for name, values in columns.items():
+            if values and type(values[0]) == int:
+                arrays[name] = np.array(values, dtype=np.int64)
+            else:
+                encoded = [value.encode('utf-8') for value in values]
+                arrays[name + '_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+                arrays[name + '_offsets'] = np.cumsum([0] + [len(value) for value in encoded], dtype=np.int64)
+        np.savez(filePath, **arrays)
+    return filePath
+
+def readColumnar(filePath):
+    """
+    Read a file written by writeColumnar
+
+    Returns
+    -------
+    dict
+        Column name to list of values
+    """
+    if filePath.endswith('.parquet'):
+        return pyarrow.parquet.read_table(filePath).to_pydict()
+    if filePath.endswith('.arrow'):
+        return pyarrow.feather.read_table(filePath).to_pydict()
+
+    columns = {}
+    with np.load(filePath) as arrays:
+        for name in arrays.files:
+            if name.endswith('_offsets'):
+                continue
+            if name.endswith('_data'):
+                data = arrays[name].tobytes()
+                offsets = arrays[name[:-len('_data')] + '_offsets'].tolist()
+                columns[name[:-len('_data')]] = [data[offsets[i]:offsets[i+1]].decode('utf-8') for i in range(len(offsets)-1)]
+            else:
+                columns[name] = arrays[name].tolist()
+    return columns
+
+
+#=============================================================
+class MergeStats:
+    """
+    Counters and phase timers of a run, passed to its progressCallback and returned by it
+
+    Attributes
+    ----------
+    total : int
+        The entries read
+    withoutAuthor, withoutYear, withoutJournal : int
+        The entries removed for a missing author, year or publisher
+    duplicates : int
+        The entries merged into an earlier entry, including near duplicates
+    nearDuplicates : int
+        The entries merged as near duplicates
+    merged : int
+        The merges that added or changed fields of the earlier entry
+    final : int
+        The entries of the merged bib file
+    files : int
+        The bib files read
+    indexHits : dict
+        The duplicates found by 'doi', by 'title' and by 'near' title
+    indexMisses : int
+        The accepted entries without a duplicate
+    timings : dict
+        Seconds spent in the phases 'parse', 'extract', 'dedup' and 'write'
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.withoutAuthor = 0
+        self.withoutYear = 0
+        self.withoutJournal = 0
+        self.duplicates = 0
+        self.nearDuplicates = 0
+        self.merged = 0
+        self.final = 0
+        self.files = 0
+        self.indexHits = {'doi': 0, 'title': 0, 'near': 0}
+        self.indexMisses = 0
+        self.timings = {'parse': 0.0, 'extract': 0.0, 'dedup': 0.0, 'write': 0.0}
+
+    def asDict(self):
+        stats = dict(vars(self))
+        stats['indexHits'] = dict(self.indexHits)
+        stats['timings'] = dict(self.timings)
+        return stats
+
+
+#=============================================================
+def run(folderPath, fileList, fileNameOut, logProcess, nearDuplicates=False, similarityThreshold=0.8, workers=1, storePath=None, cachePath=None, columnarOut=None,
+        progressCallback=None, progressInterval=0.5):
+    """
+    Merge the bib files of fileList into fileNameOut, removing entries without
+    author, year or publisher and merging duplicates
+
+    Attributes
+    ----------
+    folderPath : str
+        The folder of the bib files and the output file
+    fileList : list of str
+        The bib file names to merge
+    fileNameOut : str
+        The file name of the merged bib file
+    logProcess : bool
+        Log removed and final entries to csv files in folderPath. With an
+        existing storePath the removed entries are appended to the log of the
+        previous runs
+    nearDuplicates : bool, optional
+        Also merge entries whose titles are similar but not identical,
+        found by MinHash/LSH over title shingles (default is False)
+    similarityThreshold : float, optional
+        The minimal Jaccard similarity of title shingles for near duplicates,
+        a title with subtitle is also compared without it, see MinHashIndex
+        (default is 0.8)
+    workers : int, optional
+        The number of processes parsing the bib files, the merge itself
+        always runs in order in this process (default is 1)
+    storePath : str, optional
+        The path of a MergeStore database. If set, the entries of previous
+        runs are loaded from it, files already merged are skipped and the
+        result is saved back to it (default is None)
+    cachePath : str, optional
+        The path of a ParsedFileCache database. If set, unchanged bib files
+        are loaded from it instead of being parsed again (default is None)
+    columnarOut : str, optional
+        The file name in folderPath of a columnar copy of the final csv,
+        see writeColumnar (default is None)
+    progressCallback : callable, optional
+        Called with the MergeStats and the current file name at most every
+        progressInterval seconds, after each file and once at the end with
+        None as file name (default is None)
+    progressInterval : float, optional
+        The minimal seconds between two progress updates (default is 0.5)
+
+    Returns
+    -------
+    MergeStats
+        The counters and phase timers of the run
+    """
     global mergedCont
 
+    stats = MergeStats()
+    timings = stats.timings
+
+    finalHeader = ['key','source','doi','author','year','title','publish','abstract']
     if logProcess:
-        fRemoved = open(os.path.join(folderPath, 'BibFilesMerge_removed.csv'),'w', encoding='utf-8')
-        csvRemoved = csv.writer(fRemoved, delimiter=';', quotechar='"')
-        csvRemoved.writerow(['cause','source','key','doi','author','year','title','publish'])
-        fFinal = open(os.path.join(folderPath, 'BibFilesMerge_final.csv'),'w', encoding='utf-8')
-        csvFinal = csv.writer(fFinal, delimiter=';', quotechar='"')
-        csvFinal.writerow(['key','source','doi','author','year','title','publish','abstract'])
+        # an incremental run only reads the new files, keep the removed entries of the previous runs
+        appendRemoved = storePath is not None and os.path.exists(storePath)
+        csvRemoved = BufferedCSVWriter(os.path.join(folderPath, 'BibFilesMerge_removed.csv'), ['cause','source','key','doi','author','year','title','publish'],
+                                       append=appendRemoved)
+        csvFinal = BufferedCSVWriter(os.path.join(folderPath, 'BibFilesMerge_final.csv'), finalHeader)
 
     fileNamePathOut = os.path.join(folderPath, fileNameOut)
 
     bibDataOut = BibliographyData()
+    mergeIndex = MergeIndex(similarityThreshold if nearDuplicates else None)
+    # id(entry) -> (entry, keys) of accepted entries for the export
+    exportKeys = {}
+
+    mergeStore = None
+    if storePath is not None:
+        startTime = time.perf_counter()
+        mergeStore = MergeStore(storePath)
+        mergeStore.load(bibDataOut, mergeIndex)
+        fileList = mergeStore.filterNewFiles(folderPath, fileList)
+        timings['parse'] = timings['parse'] + time.perf_counter() - startTime
+
+    parsedFileCache = None
+    if cachePath is not None:
+        parsedFileCache = ParsedFileCache(cachePath)
 
-    total = 0
     mergedCont = 0 
-    withoutAuthor = 0
-    withoutYear = 0 
-    withoutJornal = 0
-    duplicates = 0
+    nextProgressTime = 0
 
     print()
     print()
 
-    for bibFileName in fileList:
-       
-
-        bibData = parse_file(os.path.join(folderPath,bibFileName))
+    startTime = time.perf_counter()
+    readTime = timings['parse'] + timings['extract']
+    for bibFileName, entries in iterBibFileList(folderPath, fileList, workers, parsedFileCache, timings):
 
-        print(bibFileName + ':',len(bibData.entries.values()),"                                             ")    
-
-        for entry in bibData.entries.values():
-            total = total + 1
-            doi = getEntryDOIStr(entry)
-            author = getEntryAuthorStr(entry)
-            year = getEntryYearStr(entry)
-            title = getEntryTitleStr(entry)
-            publish = getEntryPublishStr(entry)
+        fileTotal = 0
+        for entry, (doi, author, year, title, publish, cleanTitle, firstAuthor) in entries:
+            stats.total = stats.total + 1
+            fileTotal = fileTotal + 1
 
             if author == '':
-                withoutAuthor = withoutAuthor + 1
+                stats.withoutAuthor = stats.withoutAuthor + 1
                 if logProcess:
                     #cause;source;key;doi;author;year;title;publish
                     csvRemoved.writerow(['no author', bibFileName, entry.key, doi, author, year, title, publish])
                 
             elif year == '':
-                withoutYear = withoutYear + 1
+                stats.withoutYear = stats.withoutYear + 1
                 if logProcess:
                     #cause;source;key;doi;author;year;title;publish
                     csvRemoved.writerow(['no year', bibFileName, entry.key, doi, author, year, title, publish])
                 
             elif publish == '':
-                withoutJornal = withoutJornal + 1
+                stats.withoutJournal = stats.withoutJournal + 1
                 if logProcess:
                     #cause;source;key;doi;author;year;title;publish
                     csvRemoved.writerow(['no journal', bibFileName, entry.key, doi, author, year, title, publish])
 
             else:
                 key =  entry.key.lower()
-                print("Key "+key+"               \r", end="", flush=True)
+                if time.perf_counter() >= nextProgressTime:
+                    nextProgressTime = time.perf_counter() + progressInterval
+                    print("Key "+key+"               \r", end="", flush=True)
+                    if progressCallback is not None:
+                        stats.merged = mergedCont
+                        progressCallback(stats, bibFileName)
 
                 entry.fields['source'] = bibFileName
-                oldEntry = None
-                cleanTitle = cleanStringToCompare(title)
-
-                for entryOut in bibDataOut.entries.values():
-                    if (doi != ''):
-                        doiOut = getEntryDOIStr(entryOut)
-                        if (doiOut != '' and doi == doiOut):
-                            oldEntry = entryOut
-                            break
-                    
-                    cleanOutTitle = cleanStringToCompare(entryOut.fields['title'])
-                    if (cleanTitle == cleanOutTitle):
-                        year = int(str(entry.fields['year']))
-                        yearOut = int(str(entryOut.fields['year']))
-                        diff = abs(year-yearOut)
-                        if (diff==0):
-                            oldEntry = entryOut
-                        elif (diff==1 or diff==2):
-                            try:
-                                lastname = unidecode.unidecode(entry.persons['author'][0].last_names[0]).lower()
-                            except :
-                                lastname = ""
-                                
-                            try:
-                                lastNameOut = unidecode.unidecode(entryOut.persons['author'][0].last_names[0]).lower()
-                            except :
-                                lastNameOut = ""
-                                
-                            try:
-                                firstName = unidecode.unidecode(entry.persons['author'][0].firstNames[0]).lower()
-                            except :
-                                firstName = ""
-                                
-                            try:
-                                firstNameOut = unidecode.unidecode(entryOut.persons['author'][0].firstNames[0]).lower()
-                            except :
-                                firstNameOut = ""
-
-                            if (lastname==lastNameOut or lastname==firstNameOut or lastNameOut==firstName):
-                                oldEntry = entryOut
-                                break
-
-
-  
+                oldEntry = mergeIndex.find(entry, doi, cleanTitle, firstAuthor)
+                cause = 'duplicate'
+                if (oldEntry != None):
+                    # a title match never has the same doi, see MergeIndex.find
+                    if (doi != '' and getEntryDOIStr(oldEntry) == doi):
+                        stats.indexHits['doi'] = stats.indexHits['doi'] + 1
+                    else:
+                        stats.indexHits['title'] = stats.indexHits['title'] + 1
+                elif nearDuplicates:
+                    oldEntry = mergeIndex.findNear(entry, title, firstAuthor)
+                    cause = 'near duplicate'
+                    if (oldEntry != None):
+                        stats.indexHits['near'] = stats.indexHits['near'] + 1
+                        stats.nearDuplicates = stats.nearDuplicates + 1
+
                 if (oldEntry != None):
-                    duplicates = duplicates + 1
+                    stats.duplicates = stats.duplicates + 1
 
                     if logProcess:
                         #cause;source;key;doi;author;year;title;publish
-                        csvRemoved.writerow(['duplicate of next', bibFileName, entry.key, doi, author, year, title, publish])
+                        csvRemoved.writerow([cause + ' of next', bibFileName, entry.key, doi, author, year, title, publish])
 
-                        doi = getEntryDOIStr(oldEntry)
-                        author = getEntryAuthorStr(oldEntry)
-                        year = getEntryYearStr(oldEntry)
-                        title = getEntryTitleStr(oldEntry)
-                        publish = getEntryPublishStr(oldEntry)
-                        csvRemoved.writerow(['duplicate of prev', oldEntry.fields['source'], oldEntry.key, doi, author, year, title, publish])
+                        doi, author, year, title, publish = getEntryExportKeys(oldEntry, exportKeys)
+                        csvRemoved.writerow([cause + ' of prev', oldEntry.fields['source'], oldEntry.key, doi, author, year, title, publish])
 
+                    replacedEntry = bibDataOut.entries.get(oldEntry.key)
                     bibDataOut.entries[oldEntry.key] = mergeEntry(oldEntry, entry)
+                    exportKeys.pop(id(oldEntry), None)
+                    if mergeStore is not None:
+                        mergeStore.markDirty(oldEntry)
+                    if replacedEntry is oldEntry:
+                        mergeIndex.update(oldEntry)
+                    else:
+                        # the merged entry was stored under a suffixed key and overwrote another slot
+                        mergeIndex.rebuild(bibDataOut.entries.values())
 
                 else:
+                    stats.indexMisses = stats.indexMisses + 1
                     while (key in bibDataOut.entries.keys()):
                         key = key +"_a"
                     bibDataOut.entries[key] = entry
+                    mergeIndex.add(entry, cleanTitle, firstAuthor)
+                    exportKeys[id(entry)] = (entry, (doi, author, year, title, publish))
+                    if mergeStore is not None:
+                        mergeStore.markDirty(entry)
+
+        print(bibFileName + ':',fileTotal,"                                             ")
+        stats.files = stats.files + 1
+        if mergeStore is not None:
+            mergeStore.addFile(bibFileName, fileTotal)
+        if progressCallback is not None:
+            stats.merged = mergedCont
+            progressCallback(stats, bibFileName)
+
+    timings['dedup'] = time.perf_counter() - startTime - (timings['parse'] + timings['extract'] - readTime)
+
+    stats.merged = mergedCont
+    stats.final = len(bibDataOut.entries)
 
     print("                                                     ")
-    print("Total:\t\t", total)
+    print("Total:\t\t", stats.total)
 
-    print("No Author:\t", withoutAuthor)
-    print("No Year:\t", withoutYear)
-    print("No Publisher:\t", withoutJornal)
+    print("No Author:\t", stats.withoutAuthor)
+    print("No Year:\t", stats.withoutYear)
+    print("No Publisher:\t", stats.withoutJournal)
 
-    print("Duplicates:", duplicates, "| Merged:",mergedCont)
-    print("Final:\t\t", len(bibDataOut.entries))
+    print("Duplicates:", stats.duplicates, "| Merged:",stats.merged)
+    print("Final:\t\t", stats.final)
 
 
+    startTime = time.perf_counter()
     withoutAbstractList = {i: 0 for i in fileList}
     withoutAbstract = 0 
-    for entry in bibDataOut.entries.values():
-        if logProcess:
-            doi = getEntryDOIStr(entry)
-            author = getEntryAuthorStr(entry)
-            year = getEntryYearStr(entry)
-            title = getEntryTitleStr(entry)
-            publish = getEntryPublishStr(entry)
+    if logProcess or columnarOut is not None:
+        finalRows = []
+        for entry in bibDataOut.entries.values():
+            doi, author, year, title, publish = getEntryExportKeys(entry, exportKeys)
             abstract = getEntryAbstractStr(entry)
 
             #key;source;doi;author;year;title;publish;abstract
-            csvFinal.writerow([entry.key, entry.fields['source'], doi, author, year, title, publish, abstract])
+            finalRows.append([entry.key, entry.fields['source'], doi, author, year, title, publish, abstract])
+
+        if logProcess:
+            csvFinal.writerows(finalRows)
+        if columnarOut is not None:
+            print("Columnar:\t", writeColumnar(os.path.join(folderPath, columnarOut), finalHeader, finalRows))
 
     #     if not 'abstract' in entry.fields:
     #         withoutAbstract = withoutAbstract + 1
@@ -270,11 +1214,25 @@ def run(folderPath, fileList, fileNameOut, logProcess):
 
     # print("without Abstract ", withoutAbstract, withoutAbstractList)
 
-    bibDataOut.to_file(fileNamePathOut)
+    if mergeStore is not None:
+        mergeStore.writeBib(bibDataOut, fileNamePathOut)
+    else:
+        bibDataOut.to_file(fileNamePathOut)
+
+    if mergeStore is not None:
+        mergeStore.save(bibDataOut)
+        mergeStore.close()
+    if parsedFileCache is not None:
+        parsedFileCache.close()
 
     if logProcess:
-        fRemoved.close()
-        fFinal.close()
+        csvRemoved.close()
+        csvFinal.close()
+
+    timings['write'] = time.perf_counter() - startTime
+    if progressCallback is not None:
+        progressCallback(stats, None)
+    return stats
 
 
 #=============================================================================
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+import BibFilesMerge as bfm
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#=============================================================
+words = ["virtual", "reality", "augmented", "mixed", "haptic", "feedback", "interaction", "user", "study",
+         "gaze", "tracking", "touch", "input", "display", "mobile", "gesture", "learning", "model",
+         "evaluation", "design", "immersive", "presence", "locomotion", "text", "entry", "wearable",
+         "accessibility", "collaborative", "perception", "embodiment"]
+
+firstNames = ["Anna", "Jörg", "Li", "José", "Sarah", "Kenji", "Zoë", "Mohammed", "Pierre", "Ingrid", "Wei", "Ana"]
+lastNames = ["Müller", "Smith", "Chen", "García", "O'Neil", "Tanaka", "Nguyễn", "Schäfer", "Kowalski",
+             "Johansson", "Dubois", "Rossi", "Kim", "Novák", "Papadopoulos", "Ødegaard"]
+
+venues = {
+    "acm": ["Proceedings of the 2020 CHI Conference on Human Factors in Computing Systems",
+            "Proceedings of the 33rd Annual ACM Symposium on User Interface Software and Technology",
+            "ACM Transactions on Computer-Human Interaction"],
+    "ieee": ["2020 IEEE Conference on Virtual Reality and 3D User Interfaces (VR)",
+             "IEEE Transactions on Visualization and Computer Graphics",
+             "2021 IEEE International Symposium on Mixed and Augmented Reality (ISMAR)"],
+    "sciencedirect": ["International Journal of Human-Computer Studies",
+                      "Computers & Graphics",
+                      "Computers in Human Behavior"],
+}
+
+doiPrefixes = {"acm": "10.1145", "ieee": "10.1109", "sciencedirect": "10.1016"}
+
+
+def generatePaper(rng, number):
+    """
+    Generate the fields of a synthetic paper, independent of the library it is exported from
+    """
+    title = " ".join(rng.choice(words) for _ in range(rng.randint(4, 10)))
+    title = title[0].upper() + title[1:]
+    if rng.random() < 0.3:
+        title = title + ": " + " ".join(rng.choice(words) for _ in range(rng.randint(2, 4)))
+
+    authors = [(rng.choice(lastNames), rng.choice(firstNames)) for _ in range(rng.randint(1, 5))]
+    library = rng.choice(list(venues))
+    return {
+        "number": number,
+        "title": title,
+        "authors": authors,
+        "year": rng.randint(2010, 2024),
+        "library": library,
+        "venue": rng.choice(venues[library]),
+        "doi": f"{doiPrefixes[library]}/{3000000 + number}",
+        "abstract": " ".join(rng.choice(words) for _ in range(rng.randint(30, 120))),
+    }
+
+def formatAuthors(rng, authors, library, authorVariants):
+    """
+    Format the author list the way the library exports it, with probability
+    authorVariants another common variant is used
+    """
+    style = library
+    if rng.random() < authorVariants:
+        style = rng.choice(["acm", "ieee", "sciencedirect", "ascii"])
+
+    names = []
+    for last, first in authors:
+        if style == "acm":
+            names.append(f"{last}, {first}")
+        elif style == "ieee":
+            names.append(f"{first[0]}. {last}")
+        elif style == "sciencedirect":
+            names.append(f"{first} {last}")
+        else:
+            names.append(f"{bfm.unidecode.unidecode(last)}, {bfm.unidecode.unidecode(first)}")
+    return " and ".join(names)
+
+def formatEntry(rng, paper, library, doiCoverage, yearJitter, authorVariants):
+    """
+    Format a paper as a bib entry in the style of the ACM, IEEE or ScienceDirect export
+    """
+    year = paper["year"]
+    if rng.random() < yearJitter:
+        year = year + rng.choice([-2, -1, 1, 2])
+
+    title = paper["title"]
+    if rng.random() < 0.2:
+        title = title.replace(" ", "-", 1)
+
+    doi = paper["doi"] if rng.random() < doiCoverage else ""
+    author = formatAuthors(rng, paper["authors"], library, authorVariants)
+    venue = paper["venue"]
+    lastName = bfm.unidecode.unidecode(paper["authors"][0][0]).upper().replace("'", "")
+
+    if library == "acm":
+        key = doi if doi else f"{lastName.lower()}{year}{paper['number']}"
+        fields = [("author", author), ("title", title), ("year", year),
+                  ("publisher", "Association for Computing Machinery"), ("address", "New York, NY, USA")]
+        if doi:
+            fields += [("url", f"https://doi.org/{doi}"), ("doi", doi)]
+        fields += [("booktitle", venue), ("pages", f"1–{rng.randint(8, 20)}"), ("keywords", ", ".join(rng.sample(words, 3))),
+                   ("abstract", paper["abstract"])]
+        entryType = "inproceedings"
+    elif library == "ieee":
+        key = f"{9000000 + paper['number']}"
+        fields = [("author", author), ("booktitle", venue), ("title", title), ("year", year),
+                  ("volume", ""), ("number", ""), ("pages", f"{rng.randint(1, 500)}-{rng.randint(501, 999)}"),
+                  ("abstract", paper["abstract"]), ("keywords", ";".join(rng.sample(words, 3)))]
+        if doi:
+            fields += [("doi", doi)]
+        fields += [("ISSN", "2642-5254"), ("month", "March")]
+        entryType = "INPROCEEDINGS"
+    else:
+        key = f"{lastName}{year}{100000 + paper['number']}"
+        fields = [("title", title), ("journal", venue), ("volume", rng.randint(1, 200)), ("pages", rng.randint(100000, 199999)),
+                  ("year", year), ("issn", "1071-5819")]
+        if doi:
+            fields += [("doi", f"https://doi.org/{doi}")]
+        fields += [("url", f"https://www.sciencedirect.com/science/article/pii/S{paper['number']:016d}"),
+                   ("author", author), ("keywords", ", ".join(rng.sample(words, 3))), ("abstract", paper["abstract"])]
+        entryType = "article"
+
+    lines = ",\n".join(f"{name} = {{{value}}}" for name, value in fields)
+    return f"@{entryType}{{{key},\n{lines}\n}}\n\n"
+
+def generateCorpus(folderPath, entries, duplicateRate=0.3, doiCoverage=0.8, yearJitter=0.1, authorVariants=0.3,
+                   entriesPerFile=50, seed=0):
+    """
+    Generate synthetic ACM, IEEE and ScienceDirect style bib files named like the crawler output
+
+    Attributes
+    ----------
+    folderPath : str
+        The folder to write the bib files to
+    entries : int
+        The total number of entries
+    duplicateRate : float, optional
+        The fraction of entries that are another export of an earlier paper (default is 0.3)
+    doiCoverage : float, optional
+        The probability that an entry has a doi (default is 0.8)
+    yearJitter : float, optional
+        The probability that the year of an entry is off by 1 or 2 (default is 0.1)
+    authorVariants : float, optional
+        The probability that authors are formatted in another library's style (default is 0.3)
+    entriesPerFile : int, optional
+        The number of entries per file, one result page (default is 50)
+    seed : int, optional
+        The random seed, the same arguments always give the same files (default is 0)
+
+    Returns
+    -------
+    list of str
+        The generated file names
+    """
+    rng = random.Random(seed)
+    os.makedirs(folderPath, exist_ok=True)
+
+    papers = []
+    files = {}
+    for i in range(entries):
+        if papers and rng.random() < duplicateRate:
+            paper = rng.choice(papers)
+            library = rng.choice(list(venues))
+        else:
+            paper = generatePaper(rng, len(papers))
+            papers.append(paper)
+            library = paper["library"]
+
+        # a paper found again in the same library comes from another search,
+        # so the entry keys stay unique within each file
+        search = paper.setdefault("searches", {}).get(library, -1) + 1
+        paper["searches"][library] = search
+        entry = formatEntry(rng, paper, library, doiCoverage, yearJitter, authorVariants)
+        files.setdefault((library, search), []).append(entry)
+
+    fileList = []
+    for (library, search), searchEntries in files.items():
+        for page, start in enumerate(range(0, len(searchEntries), entriesPerFile)):
+            fileName = f"{library}_synthetic-{search}_TitleAbstract_page{page}_2010-2024.bib"
+            with open(os.path.join(folderPath, fileName), "w", encoding="utf-8") as f:
+                f.write("".join(searchEntries[start:start+entriesPerFile]))
+            fileList.append(fileName)
+    return fileList
+
+#=============================================================
+def getPeakRSS():
+    """
+    Get the peak resident set size of this process in KiB, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak = peak // 1024
+    return peak
+
+def benchmarkRun(folderPath, fileList, entries, workers=1, logProcess=True):
+    """
+    Time BibFilesMerge.run on the generated corpus in folderPath
+
+    Returns
+    -------
+    dict
+        The corpus size, the run and phase times in seconds, entries per second,
+        the MergeStats counters and the peak RSS in KiB
+    """
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = bfm.run(folderPath + os.sep, fileList, "out.bib", logProcess, workers=workers)
+    seconds = time.perf_counter() - startTime
+
+    return {
+        "entries": entries,
+        "files": len(fileList),
+        "workers": workers,
+        "seconds": seconds,
+        "entriesPerSecond": entries / seconds if seconds > 0 else None,
+        "phases": stats.timings,
+        "stats": {name: value for name, value in stats.asDict().items() if name != "timings"},
+        "peakRSSKiB": getPeakRSS(),
+    }
+
+def benchmarkRunIsolated(entries, workers=1, logProcess=True, seed=0, **corpusArgs):
+    """
+    Generate a corpus in a temporary folder and run benchmarkRun on it in a
+    fresh process, so the peak RSS belongs to the merge only
+    """
+    folderPath = tempfile.mkdtemp(prefix="BibFilesMergeBenchmark_")
+    try:
+        fileList = generateCorpus(folderPath, entries, seed=seed, **corpusArgs)
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(1) as pool:
+            return pool.apply(benchmarkRun, (folderPath, fileList, entries), {"workers": workers, "logProcess": logProcess})
+    finally:
+        shutil.rmtree(folderPath, ignore_errors=True)
+
+def main(arguments=None):
+    ap = argparse.ArgumentParser(description="Benchmark BibFilesMerge.run on synthetic bib files")
+    ap.add_argument("-n", "--entries", nargs="*", type=int, default=[1000, 10000, 100000], help="Corpus sizes")
+    ap.add_argument("-w", "--workers", type=int, default=1, help="Parser processes")
+    ap.add_argument("--duplicateRate", type=float, default=0.3)
+    ap.add_argument("--doiCoverage", type=float, default=0.8)
+    ap.add_argument("--yearJitter", type=float, default=0.1)
+    ap.add_argument("--authorVariants", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--noLog", action="store_true", help="Run without writing the csv logs")
+    ap.add_argument("-o", "--output", help="Append the results as JSON lines to this file instead of stdout")
+    args = ap.parse_args(arguments)
+
+    for entries in args.entries:
+        result = benchmarkRunIsolated(entries, workers=args.workers, logProcess=not args.noLog, seed=args.seed,
+                                      duplicateRate=args.duplicateRate, doiCoverage=args.doiCoverage,
+                                      yearJitter=args.yearJitter, authorVariants=args.authorVariants)
+        line = json.dumps(result)
+        if args.output:
+            with open(args.output, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        else:
+            print(line, flush=True)
+
+if __name__ == "__main__":
+    main()
+
+#python BibFilesMergeBenchmark.py -n 1000 10000 100000 -o bench.jsonl
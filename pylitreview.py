@@ -2,18 +2,51 @@ import time
 import tqdm
 import math
 import random
-import glob 
 import os
+import sys
+import ctypes
+import ctypes.util
+import fnmatch
+import functools
+import select
+import shutil
+import tempfile
+import threading
+import argparse
+import base64
+import atexit
+import concurrent.futures
+import gzip
+import http.client
+import csv
+import json
+import queue
+import re
+import sqlite3
+import urllib.parse
+import weakref
 
 import numpy as np
+import pybtex.database
 
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support.ui import WebDriverWait
 
 from enum import Enum
 
+try:
+    import config
+except ImportError:
+    config = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 class SearchWhere(Enum):
         Title = 1
         Abstract = 2
@@ -29,6 +62,373 @@ driver = None
 
 DEBUG = 0
 
+# Default deadline and poll interval in seconds of waitFor
+WAIT_TIMEOUT = 30
+WAIT_POLL = 0.2
+
+# Deadline and poll interval in seconds of waitForDownload, without inotify
+DOWNLOAD_TIMEOUT = 120
+DOWNLOAD_POLL = 0.2
+# Chrome and Firefox write to these until the download is complete
+DOWNLOAD_PARTIAL_SUFFIXES = (".crdownload", ".part", ".tmp")
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+downloadTrackers = {}
+downloadTrackersLock = threading.Lock()
+
+# Browser-free ACM backend, used by crawl if ACM_HTTP is set
+ACM_HTTP = False
+ACM_BASE_URL = "https://dl.acm.org"
+HTTP_TIMEOUT = 30
+HTTP_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+# Result pages of 50 a library lets us open per search, crawlPlanned splits larger searches by year
+MAX_PAGES = {Library.ACM: 39, Library.IEEE: math.inf, Library.ScienceDirect: 19}
+
+# Pages saved per output folder, see PageCheckpoint
+CHECKPOINT_FILE = ".checkpoint.sqlite"
+checkpoints = {}
+checkpointsLock = threading.Lock()
+
+# Result counts of search URLs, shared by all output folders, see ResultCountCache
+RESULT_COUNT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "pylitreview", "resultcounts.sqlite")
+RESULT_COUNT_TTL = 24 * 3600
+resultCountCache = None
+resultCountCacheLock = threading.Lock()
+
+# ScienceDirect login kept across searches and restarts, see ScienceDirectSession
+SD_SESSION_FILE = os.path.join(os.path.expanduser("~"), ".cache", "pylitreview", "sciencedirect_session.json")
+SD_SESSION_CHECK = 30 * 60
+
+# A warm driver is replaced after this many pages or resident bytes, see DriverManager
+DRIVER_MAX_PAGES = 200
+DRIVER_MAX_RSS = 1536 * 2**20
+
+# Browser profile of setupCrawler, "default" or "lean"
+CRAWLER_PROFILE = "default"
+# The lean profile turns off images, notifications and media in the prefs and
+# blocks the requests below, the crawler only needs the HTML and its scripts
+LEAN_PREFS = {"profile.managed_default_content_settings.images": 2,
+              "profile.default_content_setting_values.notifications": 2,
+              "profile.managed_default_content_settings.media_stream": 2}
+LEAN_BLOCKED_URLS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.ico",
+                     "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+                     "*.mp4", "*.webm", "*.mp3", "*.m4a"]
+LEAN_BLOCKED_HOSTS = ["google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+                      "adservice.google.com", "facebook.net", "connect.facebook.com", "hotjar.com", "scorecardresearch.com",
+                      "nr-data.net", "newrelic.com", "optimizely.com", "crazyegg.com", "pendo.io", "adnxs.com",
+                      "ads.linkedin.com", "bat.bing.com", "twitter.com/i/adsct", "quantserve.com", "mathtag.com"]
+# Libraries whose buttons are still found and displayed without stylesheets,
+# waitFor checks is_displayed which depends on the layout, none verified yet
+LEAN_BLOCK_STYLESHEETS = set()
+
+# When save_screenshot captures: "never", "failure", "sampled" (failures and
+# SCREENSHOT_SAMPLE_RATE of the other calls) or "always"
+SCREENSHOT_POLICY = "failure"
+SCREENSHOT_SAMPLE_RATE = 0.05
+SCREENSHOT_SCALE = 0.5
+SCREENSHOT_QUALITY = 60
+# Screenshots kept in the folder, None to keep all
+SCREENSHOT_RETENTION = 200
+screenshotWriter = None
+screenshotWriterLock = threading.Lock()
+
+# Trace file of enableTracing, None while tracing is disabled
+traceFile = None
+traceLock = threading.Lock()
+traceLocal = threading.local()
+
+# Default number of concurrent searches per library in a CrawlerPool
+POOL_LIBRARY_LIMITS = {Library.ACM: 2, Library.IEEE: 2, Library.ScienceDirect: 1}
+
+# The worker slot of a CrawlerPool held by this thread, given back while
+# the thread waits for a token
+crawlSlot = threading.local()
+
+class TokenBucket:
+    """
+    Request rate limit of one library, shared by all drivers and threads.
+    Every page request takes a token, tokens refill at ratePerMinute up to
+    burst, a request without a token waits for its turn
+
+    Attributes
+    ----------
+    ratePerMinute : float
+        The sustained number of requests per minute
+    burst : int, optional
+        The number of requests that may be sent at once after a pause (default is 1)
+    jitter : float, optional
+        The maximal random seconds added to each wait (default is 0)
+    """
+    def __init__(self, ratePerMinute, burst=1, jitter=0):
+        self.ratePerMinute = ratePerMinute
+        self.burst = burst
+        self.jitter = jitter
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token and return the seconds until it may be used, waiting
+        callers queue up in order of their reservation
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.ratePerMinute / 60)
+            self.updated = now
+            self.tokens -= 1
+            delay = max(0, -self.tokens) * 60 / self.ratePerMinute
+        return delay + random.uniform(0, self.jitter)
+
+    def wait(self):
+        """
+        Sleep until the next request may be sent
+        """
+        delay = self.reserve()
+        if delay > 0:
+            slot = getattr(crawlSlot, "semaphore", None)
+            with span("rate limit wait"):
+                if slot is not None:
+                    slot.release()
+                try:
+                    time.sleep(delay)
+                finally:
+                    if slot is not None:
+                        slot.acquire()
+
+# Requests per minute, burst and jitter in seconds per library, the only
+# place the crawler paces its requests
+politeness = {Library.ACM: TokenBucket(30, burst=2, jitter=1),
+              Library.IEEE: TokenBucket(20, burst=2, jitter=1.5),
+              Library.ScienceDirect: TokenBucket(20, burst=1, jitter=1.5)}
+
+#=============================================================
+# Tracing: named spans written as JSON lines to the file given to
+# enableTracing, while disabled span and traced only check traceFile
+
+class Span:
+    """
+    A timed step, written to the trace with the context of its thread when it ends
+    """
+    __slots__ = ("name", "attrs", "start", "startTime", "outcome")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.outcome = None
+
+    def __enter__(self):
+        self.startTime = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        seconds = time.perf_counter() - self.start
+        outcome = self.outcome or ("ok" if excType is None else f"error {excType.__name__}")
+        record = {"span": self.name}
+        record.update(getattr(traceLocal, "context", {}))
+        record.update(self.attrs)
+        record.update({"seconds": round(seconds, 6), "outcome": outcome, "start": self.startTime,
+                       "thread": threading.current_thread().name})
+        line = json.dumps(record, default=str) + "\n"
+        with traceLock:
+            if traceFile is not None:
+                traceFile.write(line)
+        return False
+
+    def fail(self, outcome="failed"):
+        self.outcome = outcome
+
+class NoSpan:
+    """
+    The span returned while tracing is disabled
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        return False
+
+    def fail(self, outcome="failed"):
+        pass
+
+noSpan = NoSpan()
+
+def span(name, **attrs):
+    """
+    Time a step, use as "with span(name) as s:", s.fail(outcome) marks it as failed
+    """
+    if traceFile is None:
+        return noSpan
+    return Span(name, attrs)
+
+def traceContext(**attrs):
+    """
+    Add attributes, e.g. the page, to the spans of this thread until the
+    enclosing traced function returns
+    """
+    if traceFile is None:
+        return
+    context = dict(getattr(traceLocal, "context", {}))
+    context.update(attrs)
+    traceLocal.context = context
+
+def getTraceJob(infos):
+    searchWhere = str(infos["SearchWhere"]).split(".")[-1]
+    return f'{"--".join(infos["Keyword"])}_{searchWhere}_{infos["YearStart"]}-{infos["YearEnd"]}'
+
+def traced(function):
+    """
+    Decorator: a span per call named like the function. An infos argument sets
+    library and job for the spans inside, a result of False or (False, ...)
+    is the outcome "failed"
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if traceFile is None:
+            return function(*args, **kwargs)
+        context = getattr(traceLocal, "context", {})
+        for a in list(args) + list(kwargs.values()):
+            if isinstance(a, dict) and "Library" in a and "Keyword" in a:
+                traceLocal.context = dict(context, library=str(a["Library"]).split(".")[-1], job=getTraceJob(a))
+                break
+        try:
+            with Span(function.__name__, {}) as s:
+                result = function(*args, **kwargs)
+                if result is False or (isinstance(result, tuple) and len(result) > 0 and result[0] is False):
+                    s.fail()
+                return result
+        finally:
+            traceLocal.context = context
+    return wrapper
+
+def enableTracing(tracePath):
+    """
+    Append the spans of all threads to tracePath as JSON lines
+    """
+    global traceFile
+    with traceLock:
+        if traceFile is not None:
+            traceFile.close()
+        traceFile = open(tracePath, "a", encoding="utf-8", buffering=1)
+
+def disableTracing():
+    global traceFile
+    with traceLock:
+        if traceFile is not None:
+            traceFile.close()
+        traceFile = None
+
+def summarizeTrace(tracePath):
+    """
+    Print the latency percentiles per library and span of a trace
+
+    Returns
+    -------
+    list of dict
+        Per library and span the count, failures, p50, p90, p99, max and total seconds
+    """
+    groups = {}
+    with open(tracePath, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            key = (record.get("library") or "-", record["span"])
+            group = groups.setdefault(key, {"seconds": [], "failed": 0})
+            group["seconds"].append(record["seconds"])
+            group["failed"] += record.get("outcome") != "ok"
+
+    rows = []
+    for (library, name), group in sorted(groups.items()):
+        seconds = np.array(group["seconds"])
+        p50, p90, p99 = np.percentile(seconds, [50, 90, 99])
+        rows.append({"library": library, "span": name, "count": len(seconds), "failed": group["failed"],
+                     "p50": p50, "p90": p90, "p99": p99, "max": seconds.max(), "total": seconds.sum()})
+
+    print(f'{"library":<14}{"span":<36}{"count":>7}{"failed":>7}{"p50":>9}{"p90":>9}{"p99":>9}{"max":>9}{"total":>10}')
+    for r in rows:
+        print(f'{r["library"]:<14}{r["span"][:35]:<36}{r["count"]:>7}{r["failed"]:>7}'
+              f'{r["p50"]:>9.3f}{r["p90"]:>9.3f}{r["p99"]:>9.3f}{r["max"]:>9.3f}{r["total"]:>10.1f}')
+    return rows
+
+def waitFor(driver, condition, timeOut=WAIT_TIMEOUT, pollInterval=WAIT_POLL, description=None):
+    """
+    Poll a condition until it is met or the deadline passes
+
+    Attributes
+    ----------
+    driver : selenium.webdriver or selenium.webdriver.element
+        The driver or element passed to the condition
+    condition : callable
+        Called with driver, returns a falsy value while not met
+    timeOut : float, optional
+        The deadline in seconds (default is WAIT_TIMEOUT)
+    pollInterval : float, optional
+        The seconds between two polls (default is WAIT_POLL)
+    description : str, optional
+        The condition in the warning printed on timeout (default is None)
+
+    Returns
+    -------
+    bool
+        True if the condition was met
+    object
+        The last value returned by condition, None on timeout
+    """
+    wait = WebDriverWait(driver, timeOut, poll_frequency=pollInterval,
+                         ignored_exceptions=(NoSuchElementException, StaleElementReferenceException))
+    with span(f'wait {description}') as s:
+        try:
+            return True, wait.until(condition)
+        except TimeoutException:
+            s.fail("timeout")
+            print_debug(f'Warning: Timeout after {timeOut}s waiting for {description}', 0)
+            return False, None
+
+def elementPresent(by, value, number=0, text=None):
+    """
+    Condition for waitFor: the element is in the DOM
+
+    Attributes
+    ----------
+    by : selenium.webdriver.common.by
+        The search method
+    value : str
+        The search value
+    number : int, optional
+        The number of the element to return, if None all elements are
+        returned as a list (default is 0)
+    text : str, optional
+        Only count elements with this text (default is None)
+    """
+    def condition(driver):
+        elements = driver.find_elements(by=by, value=value)
+        if text is not None:
+            elements = [e for e in elements if e.text == text]
+        if number is None:
+            return elements if len(elements) > 0 else False
+        return elements[number] if len(elements) > number else False
+    return condition
+
+def elementClickable(by, value, number=0, text=None):
+    """
+    Condition for waitFor: the element is in the DOM, displayed and enabled,
+    see elementPresent
+    """
+    present = elementPresent(by, value, number, text)
+    def condition(driver):
+        element = present(driver)
+        if element and element.is_displayed() and element.is_enabled():
+            return element
+        return False
+    return condition
+
 def getElement(driver, by, value, number=None, timeOut=3, maxTry=5):
     """
     Get the element from the driver in a safe way by waiting for the element to appear
@@ -45,9 +445,10 @@ def getElement(driver, by, value, number=None, timeOut=3, maxTry=5):
         The number of the element to return (default is None)
         If None all elements are returned as a list
     timeOut : int, optional
-        The time to wait for the element to appear (default is 3)
+        The time to wait for the element to appear per try (default is 3)
     maxTry : int, optional
-        The maximum number of tries to find the element (default is 5)
+        The maximum number of tries to find the element (default is 5),
+        the element is polled every WAIT_POLL seconds until timeOut*maxTry
 
     Returns
     -------
@@ -58,36 +459,230 @@ def getElement(driver, by, value, number=None, timeOut=3, maxTry=5):
         None if no element was found
     """
 
-    i = 0
-    while True:
-        if (number != None):
-            if len(driver.find_elements(by=by, value=value)) > number:
-                try:
-                    element = driver.find_elements(by=by, value=value)[number]
-                    return True, element
-                except:
-                    if i >= maxTry:
-                        print_debug(f'Error: Failed to find {value} by {by}', 0)
-                        return False, None
-                    else:
-                        print_debug(f'Retrying to find to find {value} by {by}', 2)
-                    i +=1
-        else:
-            try:
-                driver.find_element(by=by, value=value)
-                elements = driver.find_elements(by=by, value=value)
-                return True, elements
-            except NoSuchElementException:
-                if i >= maxTry:
-                    print_debug(f'Warning: Failed to find {value} by {by}', 0)
-                    return False, None
-                else:
-                    print_debug(f'Retrying to find to find {value} by {by}', 2)
-                i +=1
-        time.sleep(timeOut)
-    return False, None
+    return waitFor(driver, elementPresent(by, value, number), timeOut=timeOut*maxTry, description=f'{value} by {by}')
     
     
+class DownloadTracker:
+    """
+    Watch a download folder and resolve a future for every expected download
+    as soon as the completed file is there. Uses inotify on Linux to wake up on
+    changes and falls back to polling, in both cases the folder listing is
+    diffed against the one taken when the download was expected.
+
+    Attributes
+    ----------
+    folderPath : str
+        The download folder of the browser
+    pollInterval : float, optional
+        The seconds between two listings without inotify (default is DOWNLOAD_POLL)
+    """
+    def __init__(self, folderPath, pollInterval=DOWNLOAD_POLL):
+        self.folderPath = folderPath
+        self.pollInterval = pollInterval
+        self.pending = []
+        self.claimed = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.inotify = openInotify(folderPath)
+        self.thread = threading.Thread(target=self.watch, name=f'DownloadTracker {folderPath}', daemon=True)
+        self.thread.start()
+
+    def listCompleted(self):
+        """
+        The names of the completed files in the folder, partial downloads are skipped
+        """
+        names = set()
+        with os.scandir(self.folderPath) as it:
+            for e in it:
+                if e.name.startswith(".") or e.name.endswith(DOWNLOAD_PARTIAL_SUFFIXES):
+                    continue
+                if e.is_file():
+                    names.add(e.name)
+        return names
+
+    def expect(self, pattern="*.bib"):
+        """
+        Expect a download, call before triggering it
+
+        Attributes
+        ----------
+        pattern : str, optional
+            The fnmatch pattern of the downloaded file name (default is "*.bib")
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to the path of the first new completed file matching pattern
+        """
+        download = concurrent.futures.Future()
+        with self.lock:
+            before = self.listCompleted()
+            # a renamed download frees its name for the next one
+            self.claimed &= before
+            self.pending.append((pattern, before, download))
+        return download
+
+    def scan(self):
+        with self.lock:
+            self.pending = [p for p in self.pending if not p[2].done()]
+            if len(self.pending) == 0:
+                return
+            names = self.listCompleted()
+            for p in list(self.pending):
+                pattern, before, download = p
+                new = [n for n in names - before - self.claimed if fnmatch.fnmatch(n, pattern)]
+                if len(new) == 0:
+                    continue
+                path = os.path.join(self.folderPath, min(new, key=lambda n: os.path.getmtime(os.path.join(self.folderPath, n))))
+                self.claimed.add(os.path.basename(path))
+                self.pending.remove(p)
+                if download.set_running_or_notify_cancel():
+                    download.set_result(path)
+
+    def watch(self):
+        while not self.stopped.is_set():
+            if self.inotify is not None:
+                readable, _, _ = select.select([self.inotify], [], [], self.pollInterval)
+                if readable:
+                    try:
+                        os.read(self.inotify, 64 * 1024)
+                    except BlockingIOError:
+                        pass
+            else:
+                self.stopped.wait(self.pollInterval)
+            try:
+                self.scan()
+            except OSError as e:
+                print_debug(f'Warning: Failed to list {self.folderPath}: {e}', 0)
+
+    def close(self):
+        """
+        Stop watching and cancel the pending downloads
+        """
+        self.stopped.set()
+        self.thread.join()
+        if self.inotify is not None:
+            os.close(self.inotify)
+            self.inotify = None
+        with self.lock:
+            for _, _, download in self.pending:
+                download.cancel()
+            self.pending = []
+
+def openInotify(folderPath):
+    """
+    Open an inotify file descriptor for files completed in folderPath,
+    None if inotify is not available
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(folderPath), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+def getDownloadTracker(folderPath):
+    """
+    Get the DownloadTracker of a download folder, one is started per folder
+    """
+    folderPath = os.path.abspath(folderPath)
+    with downloadTrackersLock:
+        if folderPath not in downloadTrackers:
+            os.makedirs(folderPath, exist_ok=True)
+            downloadTrackers[folderPath] = DownloadTracker(folderPath)
+        return downloadTrackers[folderPath]
+
+def closeDownloadTracker(folderPath):
+    """
+    Stop the DownloadTracker of a download folder if one was started
+    """
+    with downloadTrackersLock:
+        tracker = downloadTrackers.pop(os.path.abspath(folderPath), None)
+    if tracker is not None:
+        tracker.close()
+
+def createDownloadFolder(outputFolderBib):
+    """
+    Create a private temporary download folder inside outputFolderBib, on the
+    same file system so finished files can be moved atomically
+
+    Returns
+    -------
+    str
+        The absolute path to the download folder, ending with a separator
+    """
+    os.makedirs(outputFolderBib, exist_ok=True)
+    return tempfile.mkdtemp(prefix=".download_", dir=os.path.abspath(outputFolderBib)) + os.sep
+
+def removeDownloadFolder(downloadFolder):
+    """
+    Stop tracking and delete a folder from createDownloadFolder with any partial downloads left
+    """
+    closeDownloadTracker(downloadFolder)
+    shutil.rmtree(downloadFolder, ignore_errors=True)
+
+def setDownloadFolder(driver, downloadFolder):
+    """
+    Point the downloads of a running Chrome driver to downloadFolder
+    """
+    driver.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": os.path.abspath(downloadFolder)})
+
+def moveDownload(pathDownloaded, pathOut):
+    """
+    Move a downloaded file to its output path, the output path never holds a partial file
+
+    Attributes
+    ----------
+    pathDownloaded : str
+        The completed file in the download folder
+    pathOut : str
+        The final path, usually from getFileNameOutput, replaced if it exists
+    """
+    with span("rename"):
+        try:
+            os.replace(pathDownloaded, pathOut)
+        except OSError:
+            # another file system, copy next to the target and rename there
+            fd, tmpPath = tempfile.mkstemp(prefix=".", suffix=".part", dir=os.path.dirname(os.path.abspath(pathOut)))
+            os.close(fd)
+            try:
+                shutil.copyfile(pathDownloaded, tmpPath)
+                os.replace(tmpPath, pathOut)
+            except:
+                os.remove(tmpPath)
+                raise
+            os.remove(pathDownloaded)
+
+def waitForDownload(download, timeOut=DOWNLOAD_TIMEOUT, description=None):
+    """
+    Wait for a download expected with DownloadTracker.expect
+
+    Returns
+    -------
+    bool
+        True if the download completed in time
+    str
+        The path to the downloaded file, empty on timeout
+    """
+    with span("download wait") as s:
+        try:
+            return True, download.result(timeout=timeOut)
+        except concurrent.futures.TimeoutError:
+            download.cancel()
+            s.fail("timeout")
+            print_debug(f'Warning: Timeout after {timeOut}s waiting for download {description}', 0)
+            return False, ""
+        except concurrent.futures.CancelledError:
+            s.fail("cancelled")
+            return False, ""
+
 def getFileNameOutput(infos, outputFolderBib, pagenr):
     """
     Get the output file name for the bib file
@@ -105,9 +700,190 @@ def getFileNameOutput(infos, outputFolderBib, pagenr):
     searchWhere = str(infos["SearchWhere"]).split(".")[-1]
     return f'{outputFolderBib}{library}_{name}_{searchWhere}_page{pagenr}_{infos["YearStart"]}-{infos["YearEnd"]}.bib'
 
-def save_screenshot(driver, infos, path = "./screenshots/"): 
+def isBibFileComplete(filePath):
+    """
+    True if filePath exists and parses as a bib file with at least one entry
+    """
+    if not os.path.isfile(filePath) or os.path.getsize(filePath) == 0:
+        return False
+    try:
+        return len(pybtex.database.parse_file(filePath, bib_format="bibtex").entries) > 0
+    except Exception:
+        return False
+
+class PageCheckpoint:
+    """
+    Record of every result page saved to an output folder, so an interrupted
+    search continues at the first missing page. A page counts as done if it
+    was recorded and its file is unchanged, or if its file exists and parses
+
+    Attributes
+    ----------
+    checkpointPath : str
+        The sqlite file of the checkpoint
+    """
+    def __init__(self, checkpointPath):
+        self.checkpointPath = checkpointPath
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(checkpointPath, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+            library TEXT, keywords TEXT, searchWhere TEXT, yearStart INTEGER, yearEnd INTEGER, page INTEGER,
+            path TEXT, size INTEGER, mtime INTEGER,
+            PRIMARY KEY (library, keywords, searchWhere, yearStart, yearEnd, page))""")
+        self.connection.commit()
+
+    @staticmethod
+    def getKey(infos, page):
+        return (infos["Library"].name, "--".join(infos["Keyword"]), infos["SearchWhere"].name,
+                int(infos["YearStart"]), int(infos["YearEnd"]), page)
+
+    def isDone(self, infos, outputFolderBib, page):
+        """
+        True if the page of the search is saved in outputFolderBib
+        """
+        filePath = getFileNameOutput(infos, outputFolderBib, page)
+        if not os.path.isfile(filePath):
+            return False
+        stat = os.stat(filePath)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, mtime FROM pages WHERE library=? AND keywords=? AND searchWhere=? AND yearStart=? AND yearEnd=? AND page=?",
+                self.getKey(infos, page)).fetchone()
+        if row == (stat.st_size, stat.st_mtime_ns):
+            return True
+        if isBibFileComplete(filePath):
+            self.markDone(infos, outputFolderBib, page)
+            return True
+        return False
+
+    def markDone(self, infos, outputFolderBib, page):
+        """
+        Record a page after its file was saved with getFileNameOutput
+        """
+        filePath = getFileNameOutput(infos, outputFolderBib, page)
+        stat = os.stat(filePath)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    self.getKey(infos, page) + (filePath, stat.st_size, stat.st_mtime_ns))
+            self.connection.commit()
+
+    def missingPages(self, infos, outputFolderBib, pages):
+        """
+        The pages of range(pages) that are not done yet
+        """
+        missing = [i for i in range(pages) if not self.isDone(infos, outputFolderBib, i)]
+        if len(missing) < pages:
+            print_debug(f'Resume {infos["Keyword"]} at page {missing[0] if missing else pages}, {pages - len(missing)} of {pages} pages done', 1)
+        return missing
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def getCheckpoint(outputFolderBib):
+    """
+    Get the PageCheckpoint of an output folder, stored in it as CHECKPOINT_FILE
+    """
+    checkpointPath = os.path.abspath(os.path.join(outputFolderBib, CHECKPOINT_FILE))
+    with checkpointsLock:
+        if checkpointPath not in checkpoints:
+            os.makedirs(os.path.dirname(checkpointPath), exist_ok=True)
+            checkpoints[checkpointPath] = PageCheckpoint(checkpointPath)
+        return checkpoints[checkpointPath]
+
+class ResultCountCache:
+    """
+    Persistent cache of the result counts of search URLs, so a search that was
+    counted recently is neither loaded again nor needs a browser for planning
+
+    Attributes
+    ----------
+    cachePath : str
+        The sqlite file of the cache
+    ttl : float, optional
+        Seconds after which a count is loaded again (default is RESULT_COUNT_TTL)
+    """
+    def __init__(self, cachePath, ttl=RESULT_COUNT_TTL):
+        self.cachePath = cachePath
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cachePath, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS counts (url TEXT PRIMARY KEY, count INTEGER, pages INTEGER, timestamp REAL)")
+        self.connection.execute("DELETE FROM counts WHERE timestamp < ?", (time.time() - ttl,))
+        self.connection.commit()
+
+    def get(self, url):
+        """
+        Get (count, pages, timestamp) of url, None if it is not cached or expired
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT count, pages, timestamp FROM counts WHERE url=?", (url,)).fetchone()
+        if row is None or row[2] < time.time() - self.ttl:
+            return None
+        return row
+
+    def put(self, url, count, pages):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?)", (url, count, pages, time.time()))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def getResultCountCache():
+    """
+    Get the ResultCountCache at RESULT_COUNT_CACHE, opened on first use
+    """
+    global resultCountCache
+    with resultCountCacheLock:
+        if resultCountCache is None:
+            os.makedirs(os.path.dirname(RESULT_COUNT_CACHE), exist_ok=True)
+            resultCountCache = ResultCountCache(RESULT_COUNT_CACHE)
+        return resultCountCache
+
+def getPageCount(library, searchResultCount):
+    """
+    The number of result pages a search downloads
+    """
+    return int(min(math.ceil(max(searchResultCount, 0) / 50), MAX_PAGES[library]))
+
+def getCachedResultCount(library, url, readCount, cacheZero=True):
     """
-    Save a screenshot of the current page
+    Get the result count of url from the ResultCountCache, or from readCount
+    and store it
+
+    Attributes
+    ----------
+    library : Library Enum
+        The library of the search
+    url : str
+        The search URL
+    readCount : callable
+        Loads the search and returns (success, searchResultCount)
+    cacheZero : bool, optional
+        Also cache searches without results, off where a page that failed to
+        load also reads as 0 (default is True)
+    """
+    cache = getResultCountCache()
+    cached = cache.get(url)
+    if cached is not None:
+        print_debug(f'Cached result count {cached[0]} of {url}', 2)
+        return True, cached[0]
+    with span("result count") as s:
+        success, searchResultCount = readCount()
+        if not success:
+            s.fail()
+    if success and (searchResultCount > 0 or cacheZero):
+        cache.put(url, searchResultCount, getPageCount(library, searchResultCount))
+    return success, searchResultCount
+
+def save_screenshot(driver, infos, path = "./screenshots/", failure=False): 
+    """
+    Save a screenshot of the current page if SCREENSHOT_POLICY asks for it.
+    Only the capture blocks the crawl, a downscaled JPEG is decoded and
+    written on a background thread and the folder is pruned to
+    SCREENSHOT_RETENTION files
 
     Attributes
     ----------
@@ -117,13 +893,57 @@ def save_screenshot(driver, infos, path = "./screenshots/"):
         The information about the search
     path : str, optional
         The path to save the screenshot (default is "./screenshots/")
+    failure : bool, optional
+        The search failed, captured unless the policy is "never" (default is False)
     """
+    if SCREENSHOT_POLICY == "never":
+        return
+    if not failure and not (SCREENSHOT_POLICY == "always" or
+                            (SCREENSHOT_POLICY == "sampled" and random.random() < SCREENSHOT_SAMPLE_RATE)):
+        return
+
     library = str(infos["Library"]).split(".")[-1]
     name = "".join(infos["Keyword"])
     searchWhere = str(infos["SearchWhere"]).split(".")[-1]
+    filePath = f"{path}{library}_{name}_{searchWhere}_{int(time.time() * 1000)}{'_failure' if failure else ''}"
 
-    os.makedirs(path, exist_ok=True)
-    driver.save_screenshot(f"{path}{library}_{name}_{searchWhere}_{int(time.time())}.png")
+    try:
+        size = driver.execute_script("return [document.documentElement.clientWidth, document.documentElement.clientHeight];")
+        data = driver.execute_cdp_cmd("Page.captureScreenshot", {
+            "format": "jpeg", "quality": SCREENSHOT_QUALITY,
+            "clip": {"x": 0, "y": 0, "width": size[0], "height": size[1], "scale": SCREENSHOT_SCALE}})["data"]
+        filePath += ".jpg"
+    except Exception:
+        # not Chrome or the page is gone, take what the driver gives
+        try:
+            data = driver.get_screenshot_as_base64()
+        except Exception as e:
+            print_debug(f'Warning: Screenshot failed: {e}', 1)
+            return
+        filePath += ".png"
+
+    global screenshotWriter
+    with screenshotWriterLock:
+        if screenshotWriter is None:
+            screenshotWriter = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshots")
+    screenshotWriter.submit(writeScreenshot, data, filePath, path)
+
+def writeScreenshot(data, filePath, path):
+    """
+    Decode and write a base64 screenshot, then delete the oldest ones over SCREENSHOT_RETENTION
+    """
+    try:
+        os.makedirs(path, exist_ok=True)
+        with open(filePath, "wb") as f:
+            f.write(base64.b64decode(data))
+        if SCREENSHOT_RETENTION is not None:
+            screenshots = [e for e in os.scandir(path) if e.is_file() and e.name.endswith((".png", ".jpg"))]
+            if len(screenshots) > SCREENSHOT_RETENTION:
+                screenshots.sort(key=lambda e: e.stat().st_mtime)
+                for e in screenshots[:len(screenshots) - SCREENSHOT_RETENTION]:
+                    os.remove(e.path)
+    except OSError as e:
+        print_debug(f'Warning: Failed to write screenshot {filePath}: {e}', 0)
     
 def print_debug (text, level=1):
     if DEBUG >= level:
@@ -199,6 +1019,7 @@ def getURLACM(infos):
     return 
 
 
+@traced
 def loadACMBib (toOpen, driver):
     """
     Load the ACM bib file
@@ -217,8 +1038,10 @@ def loadACMBib (toOpen, driver):
     int
         0 if no results were found, 1 if results were found, -1 if an error occured
     """
+    politeness[Library.ACM].wait()
     try:
-        driver.get(toOpen)
+        with span("page load"):
+            driver.get(toOpen)
     except:
         print_debug(f'Error: Failed to open {toOpen}', 0)
         return False, -1
@@ -226,6 +1049,8 @@ def loadACMBib (toOpen, driver):
     
     #iterate over middle navbar to see if query found paper results or only people
     successElement, navMiddle = getElement(driver, by=By.CLASS_NAME, value="search-result__nav", number=0, maxTry=2)
+    if not successElement:
+        return False, -1
     found = False
     for a in navMiddle.find_elements(by=By.TAG_NAME, value="a"):
         if(a.text =="RESULTS"):
@@ -238,54 +1063,50 @@ def loadACMBib (toOpen, driver):
         return True, 0
         
     # Select "Select All" to download all entries
-    successElement, element = getElement(driver, by=By.CLASS_NAME, value="item-results__checkbox", number=0)
+    successElement, element = waitFor(driver, elementClickable(By.CLASS_NAME, "item-results__checkbox"), description="Select All")
     if (successElement):
         element.click()
     else:
         return False, -1
     
     # Seach and click the "Export Citations" button
-    successElement, element = getElement(driver, by=By.CLASS_NAME, value="export-citation", number=0)
+    successElement, element = waitFor(driver, elementClickable(By.CLASS_NAME, "export-citation"), description="Export Citations")
     if (successElement):
         element.click()
     else:
         return False, -1
 
-    time.sleep(5)
-    # Get the Download button from the overlay and Dowload the bib file
-    successElement, elementOverlayExport = getElement(driver, by=By.CLASS_NAME, value="exportCitation__tabs", number=0)
+    # Get the Download button from the overlay once it is open and Dowload the bib file
+    successElement, elementOverlayExport = waitFor(driver, elementPresent(By.CLASS_NAME, "exportCitation__tabs"), description="export overlay")
     if (successElement):
-        successElement, elementButtonDownload = getElement(elementOverlayExport, by=By.CLASS_NAME, value="download__btn", number=0)
+        successElement, elementButtonDownload = waitFor(elementOverlayExport, elementClickable(By.CLASS_NAME, "download__btn"), description="Download")
         if (successElement):
             elementButtonDownload.click()
         else:
-            False, -1
+            return False, -1
     else:
-        False, -1
+        return False, -1
         
     return True, 1
         
-def saveACMBib(driver, infos, outputFolderBib):
-    acm_maxpage = 39
-    
-    keyword = [item.replace(" ", "+") for item in infos["Keyword"]]
-    
-    print_debug(f"Search for: {keyword}", 1)
-    
-    url = getURLACM(infos)
-    
-    print_debug(url, 1)
+def readACMResultCount(driver, infos):
+    """
+    Read the number of results from the loaded ACM search page
 
-    driver.get(url)
-    time.sleep(7)
-    
+    Returns
+    -------
+    bool
+        True if the count was found
+    int
+        The number of results, -1 if an error occured
+    """
     successElement, navbar = getElement(driver, by=By.CLASS_NAME, value="search-result__nav-container", number=0)
     if not successElement:
-        return False, url, -1
+        return False, -1
     
     successElement, navelements = getElement(navbar, by=By.XPATH, value=".//*", number=None)
     if not successElement:
-        return False, url, -1
+        return False, -1
         
     foundResults = False
     for nav_element in navelements:
@@ -294,60 +1115,357 @@ def saveACMBib(driver, infos, outputFolderBib):
             
     if foundResults == False: 
         print_debug("Only people in results - next keyword", 2)
-        return False, url, -1
+        return False, -1
     
     save_screenshot(driver, infos)
 
-    successElement, searchResultCount = getElement(driver, by=By.CLASS_NAME, value="result__count", number=0)
+    # the count element is rendered before its text
+    successElement, searchResultCount = waitFor(driver, elementPresent(By.CLASS_NAME, "result__count"), description="ACM results count")
     if not successElement:
-        return False, url, -1
+        return False, -1
+    waitFor(searchResultCount, lambda e: e.text.strip() != "", description="ACM results count text")
 
     searchResultCount = searchResultCount.text.split(" ")[0]
     if "," in searchResultCount:
         searchResultCount = searchResultCount.replace(",", "")
-    searchResultCount = int(searchResultCount)
+    return True, int(searchResultCount)
+
+@traced
+def saveACMBib(driver, infos, outputFolderBib, downloadFolder=None):
+    acm_maxpage = MAX_PAGES[Library.ACM]
+    
+    keyword = [item.replace(" ", "+") for item in infos["Keyword"]]
+    
+    print_debug(f"Search for: {keyword}", 1)
+    
+    url = getURLACM(infos)
+    
+    print_debug(url, 1)
+
+    def readCount():
+        politeness[Library.ACM].wait()
+        driver.get(url)
+        return readACMResultCount(driver, infos)
+    
+    successElement, searchResultCount = getCachedResultCount(Library.ACM, url, readCount)
+    if not successElement:
+        return False, url, -1
     
     if searchResultCount == 0:
         return True, url, searchResultCount
     
     r = np.min([math.ceil(searchResultCount / 50), acm_maxpage])
 
-    if (r > acm_maxpage):
+    if (math.ceil(searchResultCount / 50) > acm_maxpage):
         print_debug(f'Warning: Too many results for ACM search: {"".join(infos["Keyword"])}, only downloading the first {acm_maxpage} pages', 0)
-        return False, url, searchResultCount
     
     # Loop through all pages and save resulting bib files
-    for i in tqdm.tqdm(range(r), desc="pages"):
+    downloads = getDownloadTracker(downloadFolder or outputFolderBib)
+    checkpoint = getCheckpoint(outputFolderBib)
+    for i in tqdm.tqdm(checkpoint.missingPages(infos, outputFolderBib, r), desc="pages"):
+        traceContext(page=i)
         toOpen = url + str(i)
         
+        # acm.bib for several entries, acm_<doi>.bib for a single one
+        download = downloads.expect("acm*.bib")
         success, count = loadACMBib(toOpen, driver)
         if success and (count > 0): 
-            time.sleep(1)
-            #try:
-            tmpFile = ""
-            while True:
-                # If more than one bib element is in the file
-                if os.path.isfile(f'{outputFolderBib}acm.bib'):
-                    tmpFile = f'{outputFolderBib}acm.bib'
-                    break
-
-                # IF only one element is in the file
-                filesAvailable = glob.glob(f'{outputFolderBib}/acm_*.*.bib')
-                if (len(filesAvailable) == 1):
-                    tmpFile = filesAvailable[0]
-                    break
-                elif (len(filesAvailable) > 2):
-                    print_debug(f'Error: Too many ACM files in {outputFolderBib}', 0)
-                    break
-
-                time.sleep(1)
-                print_debug(f'Wait for file ACM bib file.', 2)
-            os.rename(tmpFile, getFileNameOutput(infos, outputFolderBib, i))
+            success, tmpFile = waitForDownload(download, description="ACM bib file")
+            if not success:
+                return False, url, searchResultCount
+            moveDownload(tmpFile, getFileNameOutput(infos, outputFolderBib, i))
+            checkpoint.markDone(infos, outputFolderBib, i)
         else:
+            download.cancel()
             return False, url, searchResultCount
             
     return True, url, searchResultCount
 
+#=============================================================
+# Browser-free ACM backend: the result DOIs are read from the search
+# HTML and exported in one request per page
+
+class HTTPSession:
+    """
+    Minimal keep-alive HTTP session on the standard library, connections to the
+    host are pooled and reused, cookies set by the server are sent back
+
+    Attributes
+    ----------
+    baseURL : str
+        Scheme and host all requests go to, e.g. https://dl.acm.org
+    timeOut : float, optional
+        The socket timeout in seconds (default is HTTP_TIMEOUT)
+    userAgent : str, optional
+        The User-Agent header (default is HTTP_USER_AGENT)
+    """
+    def __init__(self, baseURL, timeOut=HTTP_TIMEOUT, userAgent=HTTP_USER_AGENT):
+        base = urllib.parse.urlsplit(baseURL)
+        self.scheme = base.scheme
+        self.host = base.netloc
+        self.timeOut = timeOut
+        self.userAgent = userAgent
+        self.cookies = {}
+        self.connections = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def newConnection(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, timeout=self.timeOut)
+        return http.client.HTTPConnection(self.host, timeout=self.timeOut)
+
+    def connect(self):
+        try:
+            return self.connections.get_nowait()
+        except queue.Empty:
+            return self.newConnection()
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a request, the scheme and host of url are replaced by the session's
+
+        Returns
+        -------
+        int
+            The HTTP status
+        bytes
+            The decoded response body
+        """
+        parts = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        allHeaders = {"User-Agent": self.userAgent, "Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        with self.lock:
+            if self.cookies:
+                allHeaders["Cookie"] = "; ".join(f'{k}={v}' for k, v in self.cookies.items())
+        allHeaders.update(headers or {})
+
+        # a pooled connection may have been closed by the server meanwhile, retry once on a new one
+        for attempt in range(2):
+            connection = self.connect() if attempt == 0 else self.newConnection()
+            try:
+                connection.request(method, path, body=body, headers=allHeaders)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError):
+                connection.close()
+                if attempt == 1:
+                    raise
+                continue
+            break
+
+        if response.getheader("Content-Encoding", "") == "gzip":
+            data = gzip.decompress(data)
+        with self.lock:
+            for header in response.headers.get_all("Set-Cookie") or []:
+                name, _, value = header.split(";", 1)[0].partition("=")
+                self.cookies[name.strip()] = value.strip()
+        if response.will_close:
+            connection.close()
+        else:
+            self.connections.put(connection)
+        return response.status, data
+
+    def get(self, url):
+        return self.request("GET", url)
+
+    def post(self, url, fields):
+        body = urllib.parse.urlencode(fields)
+        return self.request("POST", url, body=body, headers={"Content-Type": "application/x-www-form-urlencoded"})
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+acmResultDOI = re.compile(r'class="issue-item__title"[^>]*>.*?href="(?:https://dl\.acm\.org)?/doi/(?:abs/|pdf/|full/)?(10\.\d{4,9}/[^"?#]+)"', re.S)
+acmResultCount = re.compile(r'class="(?:hitsLength|result__count)"[^>]*>\s*([\d,]+)')
+
+def getACMResultCount(html):
+    """
+    Get the number of results from an ACM search page, -1 if it is not on the page
+    """
+    match = acmResultCount.search(html)
+    if match is None:
+        return -1
+    return int(match.group(1).replace(",", ""))
+
+def getACMResultDOIs(html):
+    """
+    Get the DOIs of the results on an ACM search page in page order
+    """
+    dois = []
+    for doi in acmResultDOI.findall(html):
+        doi = urllib.parse.unquote(doi)
+        if doi not in dois:
+            dois.append(doi)
+    return dois
+
+bibEscapes = {"\\": "\\textbackslash{}", "{": "\\textbraceleft{}", "}": "\\textbraceright{}"}
+bibEscape = re.compile(r"[\\{}]")
+
+def escapeBibValue(value):
+    """
+    Make a value safe for a braced BibTeX field, braces in the text become
+    commands so the braces of the field stay balanced
+    """
+    value = bibEscape.sub(lambda m: bibEscapes[m.group(0)], str(value))
+    return " ".join(value.split())
+
+def cslToBibtex(doi, item):
+    """
+    Convert one CSL JSON item of the ACM citation export to a BibTeX entry
+    in the layout of the ACM BibTeX download
+    """
+    entryType = {"PAPER_CONFERENCE": "inproceedings", "ARTICLE": "article", "ARTICLE_JOURNAL": "article",
+                 "BOOK": "book", "CHAPTER": "inbook", "THESIS": "phdthesis"}.get(str(item.get("type", "")).upper(), "misc")
+    fields = []
+    authors = [f'{a.get("family", "")}, {a.get("given", "")}'.strip(", ") for a in item.get("author", [])]
+    if authors:
+        fields.append(("author", " and ".join(authors)))
+    if item.get("title"):
+        fields.append(("title", item["title"]))
+    dateParts = (item.get("issued") or {}).get("date-parts") or [[]]
+    if dateParts[0]:
+        fields.append(("year", dateParts[0][0]))
+    for name, key in (("isbn", "ISBN"), ("issn", "ISSN"), ("publisher", "publisher"), ("address", "publisher-place")):
+        if item.get(key):
+            fields.append((name, item[key]))
+    fields.append(("url", f"https://doi.org/{doi}"))
+    fields.append(("doi", doi))
+    if item.get("container-title"):
+        fields.append(("booktitle" if entryType == "inproceedings" else "journal", item["container-title"]))
+    for name, key in (("volume", "volume"), ("number", "issue"), ("pages", "page"), ("numpages", "number-of-pages"),
+                      ("keywords", "keyword"), ("location", "event-place"), ("series", "collection-title"), ("abstract", "abstract")):
+        if item.get(key):
+            fields.append((name, item[key]))
+
+    lines = ",\n".join(f'{name} = {{{escapeBibValue(value)}}}' for name, value in fields)
+    return f'@{entryType}{{{doi},\n{lines}\n}}\n'
+
+@traced
+def exportACMBib(session, dois):
+    """
+    Export the BibTeX of the DOIs in one request to the ACM citation export
+
+    Returns
+    -------
+    bool
+        True if the export succeeded
+    str
+        The BibTeX entries
+    """
+    status, data = session.post("/action/exportCiteProcCitation",
+                                {"dois": ",".join(dois), "targetFile": "custom-bibtex", "format": "bibTex"})
+    if status != 200:
+        print_debug(f'Error: ACM export returned HTTP {status}', 0)
+        return False, ""
+    text = data.decode("utf-8")
+    if text.lstrip().startswith("@"):
+        return True, text
+
+    try:
+        items = json.loads(text)["items"]
+    except (ValueError, KeyError, TypeError):
+        print_debug("Error: Unexpected ACM export response", 0)
+        return False, ""
+    entries = [cslToBibtex(doi, item) for element in items for doi, item in element.items()]
+    return True, "\n".join(entries)
+
+def writeFileAtomic(filePath, text):
+    """
+    Write text to filePath through a temporary file in the same folder
+    """
+    fd, tmpPath = tempfile.mkstemp(prefix=".", suffix=".part", dir=os.path.dirname(os.path.abspath(filePath)))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmpPath, filePath)
+    except:
+        os.remove(tmpPath)
+        raise
+
+@traced
+def saveACMBibHTTP(infos, outputFolderBib, session=None):
+    """
+    Save the ACM search results as bib files without a browser, one file per
+    result page named like saveACMBib
+
+    Attributes
+    ----------
+    infos : dict
+        The information about the search
+    outputFolderBib : str
+        The output folder for the bib files
+    session : HTTPSession, optional
+        The session to use, e.g. for a local test server
+        (default is a new session to ACM_BASE_URL)
+
+    Returns
+    -------
+    bool
+        True if all pages were saved
+    str
+        The search URL
+    int
+        The number of results, -1 if unknown
+    """
+    acm_maxpage = MAX_PAGES[Library.ACM]
+    url = getURLACM(infos)
+    print_debug(url, 1)
+    ownSession = session is None
+    if ownSession:
+        session = HTTPSession(ACM_BASE_URL)
+    try:
+        html = None
+        def readCount():
+            nonlocal html
+            politeness[Library.ACM].wait()
+            status, data = session.get(url + "0")
+            if status != 200:
+                print_debug(f'Error: ACM search returned HTTP {status}', 0)
+                return False, -1
+            html = data.decode("utf-8", errors="replace")
+            searchResultCount = getACMResultCount(html)
+            return searchResultCount >= 0, searchResultCount
+
+        success, searchResultCount = getCachedResultCount(Library.ACM, url, readCount)
+        if searchResultCount <= 0:
+            return success, url, searchResultCount
+
+        r = min(math.ceil(searchResultCount / 50), acm_maxpage)
+        if math.ceil(searchResultCount / 50) > acm_maxpage:
+            print_debug(f'Warning: Too many results for ACM search: {"".join(infos["Keyword"])}, only downloading the first {acm_maxpage} pages', 0)
+        checkpoint = getCheckpoint(outputFolderBib)
+        for i in tqdm.tqdm(checkpoint.missingPages(infos, outputFolderBib, r), desc="pages"):
+            traceContext(page=i)
+            # the first page is already loaded unless the count was cached
+            if i > 0 or html is None:
+                politeness[Library.ACM].wait()
+                status, data = session.get(url + str(i))
+                if status != 200:
+                    print_debug(f'Error: ACM search returned HTTP {status}', 0)
+                    return False, url, searchResultCount
+                html = data.decode("utf-8", errors="replace")
+            dois = getACMResultDOIs(html)
+            if len(dois) == 0:
+                print_debug(f'Error: No results on ACM page {i}', 0)
+                return False, url, searchResultCount
+            success, bib = exportACMBib(session, dois)
+            if not success:
+                return False, url, searchResultCount
+            writeFileAtomic(getFileNameOutput(infos, outputFolderBib, i), bib)
+            checkpoint.markDone(infos, outputFolderBib, i)
+    finally:
+        if ownSession:
+            session.close()
+
+    return True, url, searchResultCount
+
 def getURLIEEE(infos):
     """
     Get the URL for the IEEE search
@@ -404,7 +1522,8 @@ def getURLIEEE(infos):
     url = url + f"&rowsPerPage=50&pageNumber="
     return url
 
-def loadIEEEBib (toOpen, driver, outputFolderBib):
+@traced
+def loadIEEEBib (toOpen, driver, downloadFolder):
     """
     Load the IEEE bib file
     
@@ -414,8 +1533,8 @@ def loadIEEEBib (toOpen, driver, outputFolderBib):
         The URL to open
     driver : selenium.webdriver
         The selenium driver
-    outputFolderBib : str
-        The output folder for the bib file
+    downloadFolder : str
+        The download folder of the driver
 
     Returns
     -------
@@ -425,7 +1544,9 @@ def loadIEEEBib (toOpen, driver, outputFolderBib):
         The path to the downloaded bib file
         Empy if the file was not downloaded
     """
-    driver.get(toOpen)
+    politeness[Library.IEEE].wait()
+    with span("page load"):
+        driver.get(toOpen)
 
     ## Check if login is needed - might not be needed
     # lstLogin = driver.find_elements(by=By.TAG_NAME, value="xpl-personal-signin-custom")
@@ -443,52 +1564,39 @@ def loadIEEEBib (toOpen, driver, outputFolderBib):
     #     for elementButton in login.find_elements(by=By.TAG_NAME, value="button"):
     #         if elementButton.text == "Sign In":
     #             elementButton.click()
-    time.sleep(random.uniform(5,20))
     
-    #Click SELECT ALL to export all papers
-    found = False
-    for e in driver.find_elements(by=By.CLASS_NAME, value="results-actions-selectall"):
-        if e.text == 'Select All on Page':
-            found = True
-            e.click()
+    #Click SELECT ALL to export all papers once the results are rendered
+    found, e = waitFor(driver, elementClickable(By.CLASS_NAME, "results-actions-selectall", text='Select All on Page'), description="'Select All on Page'")
     if not found:
         print_debug("Warning: element not found 'Select All on Page'", 2)
         return False, ""
-    time.sleep(5)
+    e.click()
 
     # Find EXPORT and open the overlay
-    found = False
-    for e in driver.find_elements(by=By.CLASS_NAME, value="xpl-toggle-btn"):
-        if e.text == "Export":
-            found = True
-            e.click()
-            break
+    found, e = waitFor(driver, elementClickable(By.CLASS_NAME, "xpl-toggle-btn", text="Export"), description="'Export'")
     if not found:
-        print_debug("Warning: element not found 'Select All on Page'", 2)
+        print_debug("Warning: element not found 'Export'", 2)
         return False, ""
-    time.sleep(random.uniform(2,7))
+    e.click()
 
 
     # Press "Cistion" in the Overlay
-    elementOverlay = driver.find_elements(by=By.CLASS_NAME, value="modal-content")
-    if (len(elementOverlay) != 1):
+    found, elementOverlay = waitFor(driver, elementPresent(By.CLASS_NAME, "modal-content", number=None), description="Citation Overlay")
+    if (not found or len(elementOverlay) != 1):
         print_debug("Warning: element not found Citation Overlay", 2)
         return False, ""
     else: 
         elementOverlay = elementOverlay[0]
 
-    found = False
-    for e in elementOverlay.find_elements(by=By.CLASS_NAME, value="nav-item"):
-        if e.text == "Citations":
-            found = True
-            e.click()
-            break
+    found, e = waitFor(elementOverlay, elementClickable(By.CLASS_NAME, "nav-item", text="Citations"), description="'Citations'")
     if not found:
         print_debug("Warning: element not found 'Citations'", 2)
         return False, ""
-    time.sleep(random.uniform(2,5))
+    e.click()
 
-    
+    # Wait for the citation tab to render its options
+    waitFor(elementOverlay, lambda o: [e for e in o.find_elements(by=By.TAG_NAME, value="label") if e.get_attribute("for") == "download-bibtex"],
+            description="'BibTeX'")
     found = False
     for e in elementOverlay.find_elements(by=By.TAG_NAME, value="label"):
         if e.get_attribute("for") == "download-bibtex":
@@ -505,7 +1613,6 @@ def loadIEEEBib (toOpen, driver, outputFolderBib):
     if not found:
         print_debug("Warning: element not found 'BibTeX'", 2)
         return False, ""
-    time.sleep(random.uniform(2,3))
     
     found = False
     for e in elementOverlay.find_elements(by=By.TAG_NAME, value="label"):
@@ -523,19 +1630,14 @@ def loadIEEEBib (toOpen, driver, outputFolderBib):
     if not found:
         print_debug("Warning: element not found 'Citation and Abstract'", 2)
         return False, ""
-    time.sleep(random.uniform(2,3))
 
     # Press Downloadbutton
-    found = False
-    for e in elementOverlay.find_elements(by=By.TAG_NAME, value="button"):
-        if e.text == "Download":
-            found = True
-            e.click()
-            break
+    found, e = waitFor(elementOverlay, elementClickable(By.TAG_NAME, "button", text="Download"), description="'Download'")
     if not found:
         print_debug("Warning: element not found 'Download'", 2)
         return False, ""
-    time.sleep(random.uniform(3,7))
+    download = getDownloadTracker(downloadFolder).expect("IEEE Xplore Citation BibTeX Download*.bib")
+    e.click()
 
     ## test to get the file name from the download manager
     # if(len(driver.window_handles) == 1):
@@ -558,17 +1660,26 @@ def loadIEEEBib (toOpen, driver, outputFolderBib):
     # driver.switch_to.window(driver.window_handles[0])
     # pathToDownloadedFile = f'{outputFolderBib}{file_name}'
 
-    lstFiles = glob.glob(f'{outputFolderBib}/IEEE Xplore Citation BibTeX Download*.bib')
-    if len(lstFiles) != 1:
-        print_debug("Error: Too many IEEE Explore files in the Download folder, remove old ones before proceeding.", 1)
-        return False, ""
-    
-    pathToDownloadedFile = lstFiles[0]
-        
-    return True, pathToDownloadedFile
+    return waitForDownload(download, description="IEEE bib file")
 
-def saveIEEEBib(driver, infos, outputFolderBib):
-    ieee_maxpage = math.inf
+def readIEEEResultCount(driver):
+    """
+    Read the number of results from the loaded IEEE search page, see readACMResultCount
+    """
+    successElement, element = getElement(driver, by=By.CLASS_NAME, value="Dashboard-header", number=0)
+    if (successElement):
+        successElement, element = getElement(element, by=By.TAG_NAME, value="span", number=0)
+        if (successElement):
+            if (element.text == "No results found"):
+                return True, 0
+            successElement, element = getElement(element, by=By.TAG_NAME, value="span", number=1)
+            if successElement:
+                return True, int(element.text)
+    return False, -1
+
+@traced
+def saveIEEEBib(driver, infos, outputFolderBib, downloadFolder=None):
+    ieee_maxpage = MAX_PAGES[Library.IEEE]
     
     print_debug(f'Search for: {infos["Keyword"]}', 1)
     
@@ -578,28 +1689,14 @@ def saveIEEEBib(driver, infos, outputFolderBib):
 
     print_debug(url)
     
-    driver.get(url)
-    time.sleep(7)
-
-    save_screenshot(driver, infos)
+    def readCount():
+        politeness[Library.IEEE].wait()
+        driver.get(url)
+        save_screenshot(driver, infos)
+        return readIEEEResultCount(driver)
 
-    
-    searchResultCount = -1
-    successElement, element = getElement(driver, by=By.CLASS_NAME, value="Dashboard-header", number=0)
-    if (successElement):
-        successElement, element = getElement(element, by=By.TAG_NAME, value="span", number=0)
-        if (successElement):
-            if (element.text == "No results found"):
-                searchResultCount = 0
-            else:
-                successElement, element = getElement(element, by=By.TAG_NAME, value="span", number=1)
-                if successElement:
-                    searchResultCount = int(element.text)
-                else:
-                    return False, url, searchResultCount
-        else:
-            return False, url, searchResultCount
-    else:
+    successElement, searchResultCount = getCachedResultCount(Library.IEEE, url, readCount)
+    if not successElement:
         return False, url, searchResultCount
             
     if searchResultCount == 0:
@@ -607,19 +1704,18 @@ def saveIEEEBib(driver, infos, outputFolderBib):
     
     r = int(np.min([math.ceil(searchResultCount / 50), ieee_maxpage]))
 
-    return True, url, searchResultCount
-
-    for i in tqdm.tqdm(range(r), desc="pages"):
+    checkpoint = getCheckpoint(outputFolderBib)
+    for i in tqdm.tqdm(checkpoint.missingPages(infos, outputFolderBib, r), desc="pages"):
+        traceContext(page=i)
         toOpen = url + str(i+1)
 
-        success, pathToDownloadedFile = loadIEEEBib(toOpen, driver, outputFolderBib)
+        success, pathToDownloadedFile = loadIEEEBib(toOpen, driver, downloadFolder or outputFolderBib)
         
         if success:
-            os.rename(pathToDownloadedFile, getFileNameOutput(infos, outputFolderBib, i))
+            moveDownload(pathToDownloadedFile, getFileNameOutput(infos, outputFolderBib, i))
+            checkpoint.markDone(infos, outputFolderBib, i)
         else:
             return False, url, searchResultCount
-
-        time.sleep(2)
         
     return True, url, searchResultCount
 
@@ -653,107 +1749,217 @@ def getURLScienceDirect(infos):
     return url
 
 
-def loginScienceDirect(driver, username, password):
+@traced
+def loginScienceDirect(driver, username, password, email=None):
+    """
+    Sign in to ScienceDirect through the institution login
+
+    Attributes
+    ----------
+    driver : selenium.webdriver
+        The selenium driver
+    username : str
+        The institution user name
+    password : str
+        The institution password
+    email : str, optional
+        The e-mail address to start the sign in with (default is username)
+
+    Returns
+    -------
+    bool
+        True if all login steps were found
+    """
     Login_URL = "https://www.sciencedirect.com/"
     driver.get(Login_URL)
-    time.sleep(5)
     
     if DEBUG > 1:
         driver.save_screenshot("./screenshots/init.png")
-        
-    driver.find_element(by=By.LINK_TEXT, value="Sign in").click()
-    time.sleep(10)
-    mail = driver.find_element(by=By.ID, value="bdd-email")
-    mail.send_keys(username)
-    time.sleep(1)
-    mail.send_keys(Keys.ENTER)
-    time.sleep(1)
-    
-    if DEBUG > 1:
-        driver.save_screenshot("./screenshots/login.png")
-        
-    time.sleep(1)
-    driver.find_element(by=By.ID, value="bdd-elsPrimaryBtn").click()
-    time.sleep(1)
-    driver.find_element(by=By.ID, value="username").send_keys(username)
-    time.sleep(1)
-    pwd = driver.find_element(by=By.ID, value="password")
-    pwd.send_keys(password)
-    time.sleep(1)
-    pwd.send_keys(Keys.ENTER)
-    time.sleep(2)
-    
-    try:
-        driver.find_element(by=By.ID, value="institution-button").click()
-    except:
-        print_debug("Error: intitution button apparently no accessable", 0)
-        driver.save_screenshot("./screenshots/StaleElement.png")
-        driver.find_element(by=By.ID, value="institution-button").click()
-    time.sleep(2)
-    return driver
 
+    steps = [(elementClickable(By.LINK_TEXT, "Sign in"), "'Sign in'", lambda e: e.click()),
+             (elementClickable(By.ID, "bdd-email"), "e-mail", lambda e: (e.send_keys(email or username), e.send_keys(Keys.ENTER))),
+             (elementClickable(By.ID, "bdd-elsPrimaryBtn"), "institution sign in", lambda e: e.click()),
+             (elementClickable(By.ID, "username"), "user name", lambda e: e.send_keys(username)),
+             (elementClickable(By.ID, "password"), "password", lambda e: (e.send_keys(password), e.send_keys(Keys.ENTER))),
+             (elementClickable(By.ID, "institution-button"), "institution button", lambda e: e.click())]
+    for condition, description, action in steps:
+        success, element = waitFor(driver, condition, description=description)
+        if not success:
+            print_debug(f'Error: ScienceDirect login step {description} not found', 0)
+            if DEBUG > 1: driver.save_screenshot("./screenshots/login.png")
+            return False
+        action(element)
+    waitFor(driver, lambda d: d.execute_script("return document.readyState") == "complete", description="ScienceDirect after login")
+    return True
+
+class ScienceDirectSession:
+    """
+    Log in to ScienceDirect once and keep the session: cookies of all
+    domains and the localStorage of ScienceDirect are saved to statePath and
+    restored into new drivers, also after a restart. The login is only
+    repeated when the session check fails, a driver is checked at most every
+    checkInterval seconds
+
+    Attributes
+    ----------
+    statePath : str, optional
+        The file of the saved session (default is SD_SESSION_FILE)
+    username, password, email : str, optional
+        The login, defaults to UNI_USER, UNI_PWD and UNI_MAIL of config.py
+    checkInterval : float, optional
+        Seconds a checked session is trusted (default is SD_SESSION_CHECK)
+    """
+    def __init__(self, statePath=SD_SESSION_FILE, username=None, password=None, email=None, checkInterval=SD_SESSION_CHECK):
+        self.statePath = statePath
+        self.username = username if username is not None else getattr(config, "UNI_USER", "")
+        self.password = password if password is not None else getattr(config, "UNI_PWD", "")
+        self.email = email if email is not None else getattr(config, "UNI_MAIL", "") or None
+        self.checkInterval = checkInterval
+        self.checked = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def isLoggedIn(self, driver):
+        """
+        Load the homepage, the session is valid if it offers no "Sign in"
+        """
+        driver.get("https://www.sciencedirect.com/")
+        waitFor(driver, lambda d: d.execute_script("return document.readyState") == "complete", description="ScienceDirect homepage")
+        return len(driver.find_elements(by=By.LINK_TEXT, value="Sign in")) == 0
+
+    def save(self, driver):
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        storage = driver.execute_script("return Object.assign({}, window.localStorage);")
+        os.makedirs(os.path.dirname(os.path.abspath(self.statePath)), exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(prefix=".", dir=os.path.dirname(os.path.abspath(self.statePath)))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"cookies": cookies, "localStorage": storage, "time": time.time()}, f)
+        os.chmod(tmpPath, 0o600)
+        os.replace(tmpPath, self.statePath)
+
+    def restore(self, driver):
+        """
+        Load the saved session into driver, False if there is none
+        """
+        if not os.path.isfile(self.statePath):
+            return False
+        with open(self.statePath, encoding="utf-8") as f:
+            state = json.load(f)
+        keys = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+        cookies = [{k: c[k] for k in keys if k in c and not (k == "expires" and c[k] < 0)} for c in state["cookies"]]
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+        driver.get("https://www.sciencedirect.com/")
+        driver.execute_script("for (const [k, v] of Object.entries(arguments[0])) window.localStorage.setItem(k, v);",
+                              state.get("localStorage", {}))
+        return True
+
+    def ensure(self, driver):
+        """
+        Make sure driver is logged in, restoring the saved session or logging in
+
+        Returns
+        -------
+        bool
+            False if the login failed
+        """
+        if time.monotonic() - self.checked.get(driver, -math.inf) < self.checkInterval:
+            return True
+        with self.lock:
+            if driver not in self.checked:
+                self.restore(driver)
+            if not self.isLoggedIn(driver):
+                print_debug("Log in to ScienceDirect", 1)
+                if not loginScienceDirect(driver, self.username, self.password, self.email) or not self.isLoggedIn(driver):
+                    print_debug("Error: ScienceDirect login failed, check the credentials in config.py", 0)
+                    return False
+                self.save(driver)
+            self.checked[driver] = time.monotonic()
+        return True
+
+scienceDirectSession = ScienceDirectSession()
+
+@traced
 def loadScienceDirectBib(toOpen, driver):
-    driver.get(toOpen)
-    time.sleep(5)
+    politeness[Library.ScienceDirect].wait()
+    with span("page load"):
+        driver.get(toOpen)
+    success, element = waitFor(driver, elementClickable(By.ID, "select-all-results"), description="select all results")
+    if not success:
+        return False
     if DEBUG > 1: driver.save_screenshot("./screenshots/sciencedirect.png")
-    driver.find_element(by=By.ID, value="select-all-results").click()
-    time.sleep(1)
+    element.click()
     if DEBUG > 1: driver.save_screenshot("./screenshots/sciencedirect_clickall.png")
-    driver.find_element(by=By.CLASS_NAME, value="button-link.export-all-link-button.button-link-primary").click()
-    time.sleep(5)
-    driver.find_elements(by=By.CLASS_NAME, value="button-link.button-link-primary.export-option.u-display-block")[2].click()
-    time.sleep(10)
+    success, element = waitFor(driver, elementClickable(By.CLASS_NAME, "button-link.export-all-link-button.button-link-primary"), description="export")
+    if not success:
+        return False
+    element.click()
+    success, element = waitFor(driver, elementClickable(By.CLASS_NAME, "button-link.button-link-primary.export-option.u-display-block", number=2), description="BibTeX export")
+    if not success:
+        return False
+    element.click()
     return True
 
-def saveScienceDirectBib(driver, infos, outputFolderBib): #keywords_list, outputFolderBib, titleOnly):
-    sd_maxpage = 19
-    #driver = setupCrawler(outputFolderBib, Library.ScienceDirect)
-    url = getURLScienceDirect(infos)
-    driver.get("https://www.sciencedirect.com/")
-    
-    save_screenshot(driver, infos)
-        
-    try:
-        driver = loginScienceDirect(driver)
-    except NoSuchElementException:
-        print_debug("Already logged in or wrong credentials", 1) 
-        
-    # loginScienceDirect(driver)
-    
-    save_screenshot(driver, infos)
-
-#     for keywords in keywords_list:
-    print_debug(f'Search for: {infos["Keyword"]}', 1)
-    url = getURLScienceDirect(infos)
-    driver.get(url)
-    time.sleep(3)
+def readScienceDirectResultCount(driver):
+    """
+    Read the number of results from the loaded ScienceDirect search page, see readACMResultCount
+    """
+    # the results text is missing on pages without results
+    waitFor(driver, lambda d: [e for e in d.find_elements(by=By.CLASS_NAME, value="search-body-results-text") if e.text.strip() != ""],
+            timeOut=10, description="ScienceDirect results count")
     try:
         searchResultCount = driver.find_element(by=By.CLASS_NAME, value="search-body-results-text")
         searchResultCount = searchResultCount.text.split(" ")[0]
         if "," in searchResultCount:
             searchResultCount = searchResultCount.replace(",", "")
-        searchResultCount = int(searchResultCount)
+        return True, int(searchResultCount)
     except NoSuchElementException:
-        searchResultCount = 0
+        return True, 0
+
+@traced
+def saveScienceDirectBib(driver, infos, outputFolderBib, downloadFolder=None): #keywords_list, outputFolderBib, titleOnly):
+    sd_maxpage = MAX_PAGES[Library.ScienceDirect]
+    #driver = setupCrawler(outputFolderBib, Library.ScienceDirect)
+    url = getURLScienceDirect(infos)
+    if not scienceDirectSession.ensure(driver):
+        return False, url, -1
+
+#     for keywords in keywords_list:
+    print_debug(f'Search for: {infos["Keyword"]}', 1)
+    url = getURLScienceDirect(infos)
+    def readCount():
+        politeness[Library.ScienceDirect].wait()
+        driver.get(url)
+        return readScienceDirectResultCount(driver)
+
+    # a page that failed to load reads as 0 results, only cache real counts
+    _, searchResultCount = getCachedResultCount(Library.ScienceDirect, url, readCount, cacheZero=False)
 
     r = np.min([math.ceil(searchResultCount / 50), sd_maxpage])
 
 
-    if (r > sd_maxpage):
+    if (math.ceil(searchResultCount / 50) > sd_maxpage):
         print_debug(f'Warning: Too many results for ScienceDirect search: {"".join(infos["Keyword"])}, only downloading the first {sd_maxpage} pages', 0)
-        return False, url, searchResultCount
     
-    for i in tqdm.tqdm(range(r), desc="pages"):
+    downloads = getDownloadTracker(downloadFolder or outputFolderBib)
+    checkpoint = getCheckpoint(outputFolderBib)
+    for i in tqdm.tqdm(checkpoint.missingPages(infos, outputFolderBib, r), desc="pages"):
+        traceContext(page=i)
         # driver = setupCrawler(dl_folder)
         toOpen = url + str(i*50)
+        download = downloads.expect("*.bib")
         success = loadScienceDirectBib(toOpen, driver)
+        if not success:
+            download.cancel()
+            return False, url, searchResultCount
+        success, pathToDownloadedFile = waitForDownload(download, description="ScienceDirect bib file")
         if not success:
             return False, url, searchResultCount
+        moveDownload(pathToDownloadedFile, getFileNameOutput(infos, outputFolderBib, i))
+        checkpoint.markDone(infos, outputFolderBib, i)
 
     return True, url, searchResultCount
 
 
-def setupCrawler(targetLibrary, outputFolderBib):
+def setupCrawler(targetLibrary, outputFolderBib, downloadFolder=None, headless=True, profile=None, logPerformance=False):
     """
     Setup the crawler for the target library and return the scelenium driver object
 
@@ -763,26 +1969,271 @@ def setupCrawler(targetLibrary, outputFolderBib):
         The target library to crawl
     outputFolderBib : str
         The output folder for the bib files
+    downloadFolder : str, optional
+        The download folder of the driver, crawl points each search to its own
+        folder with setDownloadFolder (default is outputFolderBib)
+    headless : bool, optional
+        Run Chrome without a window (default is True)
+    profile : str, optional
+        "default" loads pages completely, "lean" blocks images, fonts, media
+        and tracker hosts, see applyLeanProfile (default is CRAWLER_PROFILE)
+    logPerformance : bool, optional
+        Record the DevTools network log for measurePage (default is False)
     """
     options = webdriver.ChromeOptions()
     options.add_argument('window-size=1920,1080')
     
-    if targetLibrary == Library.ACM:
+    if headless:
         options.add_argument('headless')
         options.add_argument("disable-gpu")
-    elif targetLibrary == Library.IEEE:
-        options.add_argument('headless')
-        options.add_argument("disable-gpu")
-    elif targetLibrary == Library.ScienceDirect:
-        None
-    p = {"download.default_directory": outputFolderBib}
+    p = {"download.default_directory": os.path.abspath(downloadFolder or outputFolderBib),
+         "download.prompt_for_download": False}
+    profile = profile or CRAWLER_PROFILE
+    if profile == "lean":
+        p.update(LEAN_PREFS)
+        options.add_argument("blink-settings=imagesEnabled=false")
+        options.add_argument("mute-audio")
     options.add_experimental_option("prefs", p)
+    if logPerformance:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
     #ser = Service("./chromedriver.exe")
     op = webdriver.ChromeOptions()
     driver = webdriver.Chrome(options=options) #
+    if profile == "lean":
+        applyLeanProfile(driver, targetLibrary)
     print_debug("Driver setup complete.", 1)
     return driver
 
+def getProcessTreeRSS(pid):
+    """
+    The resident memory in bytes of a process and all its descendants,
+    e.g. chromedriver and its Chrome processes, None if unknown
+    """
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            processes = [process] + process.children(recursive=True)
+        except psutil.Error:
+            return None
+        rss = 0
+        for p in processes:
+            try:
+                rss += p.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+    if not os.path.isdir("/proc"):
+        return None
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                # the command name may contain spaces, the parent pid follows its closing bracket
+                ppid = int(f.read().rsplit(b")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    rss, stack, pageSize = 0, [pid], os.sysconf("SC_PAGE_SIZE")
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                rss += int(f.read().split()[1]) * pageSize
+        except (OSError, IndexError, ValueError):
+            pass
+        stack.extend(children.get(p, []))
+    return rss
+
+class DriverManager:
+    """
+    Keep one warm driver per key, by default per library, so switching
+    libraries does not start a new browser. A driver is quit and replaced
+    after maxPages pages, once its process tree uses more than maxRSS
+    bytes or when its browser no longer answers, all drivers are quit at exit.
+    A search that fails with a WebDriverException should quit its driver
+
+    Attributes
+    ----------
+    maxPages : int, optional
+        Pages after which a driver is replaced (default is DRIVER_MAX_PAGES)
+    maxRSS : int, optional
+        Resident bytes of chromedriver and Chrome after which a driver is
+        replaced, None to not check (default is DRIVER_MAX_RSS)
+    """
+    def __init__(self, maxPages=DRIVER_MAX_PAGES, maxRSS=DRIVER_MAX_RSS):
+        self.maxPages = maxPages
+        self.maxRSS = maxRSS
+        self.drivers = {}
+        self.lock = threading.Lock()
+        driverManagers.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def isAlive(self, driver):
+        """
+        Check that the browser of driver still answers, a crashed Chrome
+        leaves a session every command fails on
+        """
+        try:
+            driver.window_handles
+            return True
+        except WebDriverException:
+            return False
+
+    def needsRecycle(self, driver, pages):
+        if not self.isAlive(driver):
+            print_debug('Replace driver whose browser does not answer', 1)
+            return True
+        if pages >= self.maxPages:
+            print_debug(f'Recycle driver after {pages} pages', 1)
+            return True
+        if self.maxRSS is not None:
+            rss = getProcessTreeRSS(driver.service.process.pid) if getattr(driver, "service", None) and driver.service.process else None
+            if rss is not None and rss > self.maxRSS:
+                print_debug(f'Recycle driver using {rss / 2**20:.0f} MiB', 1)
+                return True
+        return False
+
+    def get(self, library, outputFolderBib, key=None, headless=True):
+        """
+        Get the warm driver for key, started with setupCrawler or replaced if it is worn out
+
+        Attributes
+        ----------
+        library : Library Enum
+            The library the driver is set up for
+        outputFolderBib : str
+            The output folder for the bib files
+        key : hashable, optional
+            Drivers are kept per key (default is library)
+        """
+        key = library if key is None else key
+        with self.lock:
+            driver, pages = self.drivers.get(key, (None, 0))
+        if driver is not None and self.needsRecycle(driver, pages):
+            self.quit(key)
+            driver = None
+        if driver is None:
+            driver = setupCrawler(library, outputFolderBib, headless=headless)
+            print_debug(f'Setup Crwaler for {library}', 1)
+            with self.lock:
+                self.drivers[key] = (driver, 0)
+        return driver
+
+    def addPages(self, key, pages):
+        """
+        Count pages loaded by the driver of key
+        """
+        with self.lock:
+            if key in self.drivers:
+                driver, count = self.drivers[key]
+                self.drivers[key] = (driver, count + pages)
+
+    def quit(self, key):
+        with self.lock:
+            driver, _ = self.drivers.pop(key, (None, 0))
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception as e:
+                print_debug(f'Warning: Failed to quit driver: {e}', 1)
+
+    def close(self):
+        """
+        Quit all drivers
+        """
+        for key in list(self.drivers):
+            self.quit(key)
+
+def closeDriverManagers():
+    for manager in list(driverManagers):
+        manager.close()
+
+driverManagers = weakref.WeakSet()
+atexit.register(closeDriverManagers)
+driverManager = DriverManager()
+
+def applyLeanProfile(driver, targetLibrary):
+    """
+    Block the requests of the lean profile in a running driver through the DevTools protocol
+    """
+    patterns = LEAN_BLOCKED_URLS + [f"*{host}*" for host in LEAN_BLOCKED_HOSTS]
+    if targetLibrary in LEAN_BLOCK_STYLESHEETS:
+        patterns = patterns + ["*.css", "*.css?*"]
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+def measurePage(driver, url):
+    """
+    Load url in a driver started with logPerformance and measure it
+
+    Returns
+    -------
+    dict
+        The bytes transferred, the number of requests and the seconds until the load event
+    """
+    driver.get_log("performance")
+    startTime = time.perf_counter()
+    driver.get(url)
+    seconds = time.perf_counter() - startTime
+
+    transferred, requests = 0, 0
+    for entry in driver.get_log("performance"):
+        message = json.loads(entry["message"])["message"]
+        if message["method"] == "Network.loadingFinished":
+            transferred += message["params"].get("encodedDataLength", 0)
+        elif message["method"] == "Network.requestWillBeSent":
+            requests += 1
+    return {"url": url, "bytes": transferred, "requests": requests, "seconds": seconds}
+
+def measureProfiles(targetLibrary, urls, outputFolderBib, profiles=("default", "lean")):
+    """
+    Load the same pages with each crawler profile and print the bytes and
+    time the lean profile saves per page
+
+    Attributes
+    ----------
+    targetLibrary : Library Enum
+        The library of the pages
+    urls : list of str
+        The pages to load, e.g. search URLs
+    outputFolderBib : str
+        The output folder passed to setupCrawler
+    profiles : tuple of str, optional
+        The profiles to compare, the first one is the reference (default is ("default", "lean"))
+
+    Returns
+    -------
+    list of dict
+        One measurement per profile and page, see measurePage
+    """
+    measurements = []
+    for profile in profiles:
+        driver = setupCrawler(targetLibrary, outputFolderBib, profile=profile, logPerformance=True)
+        try:
+            for url in urls:
+                politeness[targetLibrary].wait()
+                measurements.append(dict(measurePage(driver, url), profile=profile))
+        finally:
+            driver.quit()
+
+    reference = [m for m in measurements if m["profile"] == profiles[0]]
+    for profile in profiles[1:]:
+        measured = [m for m in measurements if m["profile"] == profile]
+        savedBytes = sum(r["bytes"] - m["bytes"] for r, m in zip(reference, measured)) / max(len(measured), 1)
+        savedSeconds = sum(r["seconds"] - m["seconds"] for r, m in zip(reference, measured)) / max(len(measured), 1)
+        print(f'{profile}: {savedBytes / 1024:.0f} KiB and {savedSeconds:.2f}s saved per page against {profiles[0]}')
+    return measurements
+
+@traced
 def crawl(infos, outputFolderBib):
     """
     Crawl the target library and save the bib file
@@ -796,22 +2247,492 @@ def crawl(infos, outputFolderBib):
     """
     global globalLastLibrary
     global driver
+
+    if ACM_HTTP and infos["Library"] == Library.ACM:
+        return crawlPlanned(None, infos, outputFolderBib)
     
-    if (globalLastLibrary != infos["Library"]):
-        driver = setupCrawler(infos["Library"], outputFolderBib)
-        globalLastLibrary = infos["Library"]
-        print_debug(f'Setup Crwaler for {infos["Library"]}', 1)
+    driver = driverManager.get(infos["Library"], outputFolderBib)
+    globalLastLibrary = infos["Library"]
     
+    try:
+        success, url, searchResultCount = crawlPlanned(driver, infos, outputFolderBib)
+    except WebDriverException:
+        driverManager.quit(infos["Library"])
+        raise
+    driverManager.addPages(infos["Library"], getPageCount(infos["Library"], searchResultCount) + 1)
+    return success, url, searchResultCount
+
+@traced
+def crawlWithDriver(driver, infos, outputFolderBib):
+    """
+    Crawl the target library with the given driver and save the bib files
+
+    Attributes
+    ----------
+    driver : selenium.webdriver
+        A driver from setupCrawler for infos["Library"]
+    infos : dict
+        The information about the search
+    outputFolderBib : str
+        The output folder for the bib file
+    """
     print_debug(f'Start crawling {infos["Library"]}', 1)
+
+    if ACM_HTTP and infos["Library"] == Library.ACM:
+        return saveACMBibHTTP(infos, outputFolderBib)
+
+    # every search downloads into its own folder, files left from earlier
+    # searches or other crawlers cannot be mistaken for its downloads
+    downloadFolder = createDownloadFolder(outputFolderBib)
+    try:
+        setDownloadFolder(driver, downloadFolder)
+        if infos["Library"] == Library.ACM:
+            success, url, searchResultCount = saveACMBib(driver, infos, outputFolderBib, downloadFolder)
+        elif infos["Library"] == Library.IEEE:
+            success, url, searchResultCount = saveIEEEBib(driver, infos, outputFolderBib, downloadFolder)
+        elif infos["Library"] == Library.ScienceDirect:
+            success, url, searchResultCount = saveScienceDirectBib(driver, infos, outputFolderBib, downloadFolder)
+        else:
+            print_debug(f'Error: Library {infos["Library"]} not yet supported', 0)
+            success, url, searchResultCount = False, "", -1
+        if not success:
+            save_screenshot(driver, infos, failure=True)
+    except Exception:
+        save_screenshot(driver, infos, failure=True)
+        raise
+    finally:
+        removeDownloadFolder(downloadFolder)
         
-    if infos["Library"] == Library.ACM:
-        success, url, searchResultCount = saveACMBib(driver, infos, outputFolderBib)
-    elif infos["Library"] == Library.IEEE:
-        success, url, searchResultCount = saveIEEEBib(driver, infos, outputFolderBib)
-    elif infos["Library"] == Library.ScienceDirect:
-        keyword = [item.replace(" ", "%20") for item in keyword]
-        success, url, searchResultCount = saveScienceDirectBib(driver, infos, outputFolderBib)
-    else:
-        print_debug(f'Error: Library {infos["Library"]} not yet supported', 0)
-        
-    return success, url, searchResultCount
\ No newline at end of file
+    return success, url, searchResultCount
+
+def getSearchURL(infos):
+    """
+    Get the URL of the search in infos["Library"]
+    """
+    getURL = {Library.ACM: getURLACM, Library.IEEE: getURLIEEE, Library.ScienceDirect: getURLScienceDirect}
+    return getURL[infos["Library"]](infos)
+
+@traced
+def getResultCount(driver, infos):
+    """
+    Open the first result page of a search and read the number of results
+    without downloading anything
+
+    Attributes
+    ----------
+    driver : selenium.webdriver
+        A driver from setupCrawler for infos["Library"], None for the ACM HTTP backend
+    infos : dict
+        The information about the search
+
+    Returns
+    -------
+    bool
+        True if the count was found
+    str
+        The URL of the search
+    int
+        The number of results, -1 if an error occured
+    """
+    library = infos["Library"]
+    url = getSearchURL(infos)
+
+    def readCount():
+        # ScienceDirect shows other counts to visitors that are not signed in
+        if library == Library.ScienceDirect and not scienceDirectSession.ensure(driver):
+            return False, -1
+        politeness[library].wait()
+        if ACM_HTTP and library == Library.ACM:
+            with HTTPSession(ACM_BASE_URL) as session:
+                status, data = session.get(url + "0")
+            if status != 200:
+                return False, -1
+            searchResultCount = getACMResultCount(data.decode("utf-8", errors="replace"))
+            return searchResultCount >= 0, searchResultCount
+
+        driver.get(url)
+        if library == Library.ACM:
+            return readACMResultCount(driver, infos)
+        elif library == Library.IEEE:
+            return readIEEEResultCount(driver)
+        return readScienceDirectResultCount(driver)
+
+    success, searchResultCount = getCachedResultCount(library, url, readCount, cacheZero=library != Library.ScienceDirect)
+    return success, url, searchResultCount
+
+def planSearch(infos, countResults, maxResults):
+    """
+    Split the year range of a search in halves until every part has at most
+    maxResults results, a single year is never split further
+
+    Attributes
+    ----------
+    infos : dict
+        The information about the search
+    countResults : callable
+        Called with the infos of a (sub) search, returns (success, url, searchResultCount)
+    maxResults : int
+        The number of results that can be downloaded per search
+
+    Returns
+    -------
+    list of tuple
+        (infos, success, searchResultCount) per sub search, ordered by year
+    """
+    success, _, searchResultCount = countResults(infos)
+    yearStart, yearEnd = int(infos["YearStart"]), int(infos["YearEnd"])
+    if not success or searchResultCount <= maxResults or yearStart >= yearEnd:
+        return [(infos, success, searchResultCount)]
+
+    middle = (yearStart + yearEnd) // 2
+    print_debug(f'Split {infos["Keyword"]} {yearStart}-{yearEnd} with {searchResultCount} results at {middle}', 1)
+    return planSearch(dict(infos, YearStart=yearStart, YearEnd=middle), countResults, maxResults) + \
+           planSearch(dict(infos, YearStart=middle + 1, YearEnd=yearEnd), countResults, maxResults)
+
+def crawlPlanned(driver, infos, outputFolderBib):
+    """
+    Crawl a search like crawlWithDriver, a search with more results than the
+    library's MAX_PAGES is first split into year ranges that fit, every range
+    is saved under its own years and the results are reported for the whole search
+
+    Returns
+    -------
+    bool
+        True if all sub searches succeeded
+    str
+        The URL of the original search
+    int
+        The sum of the results of the sub searches
+    """
+    maxResults = MAX_PAGES[infos["Library"]] * 50
+    if maxResults == math.inf:
+        return crawlWithDriver(driver, infos, outputFolderBib)
+
+    plan = planSearch(infos, lambda subInfos: getResultCount(driver, subInfos), maxResults)
+    if len(plan) == 1:
+        return crawlWithDriver(driver, infos, outputFolderBib)
+
+    success, searchResultCount = True, 0
+    for subInfos, _, subCount in plan:
+        if subCount == 0:
+            continue
+        subSuccess, _, subCount = crawlWithDriver(driver, subInfos, outputFolderBib)
+        success = success and subSuccess
+        searchResultCount += max(subCount, 0)
+    return success, getSearchURL(infos), searchResultCount
+
+def estimateJobs(jobs):
+    """
+    Dry run: the size of a crawl from the ResultCountCache only, without a
+    browser or any request. Searches over the page cap are planned like
+    crawlPlanned as far as the counts of their year ranges are cached
+
+    Attributes
+    ----------
+    jobs : list of dict
+        The information about each search
+
+    Returns
+    -------
+    list of dict
+        Per job the URL, searchResultCount and pages, both None if not all
+        counts needed are cached
+    """
+    cache = getResultCountCache()
+    def countCached(infos):
+        url = getSearchURL(infos)
+        cached = cache.get(url) if url else None
+        if cached is None:
+            return False, url, -1
+        return True, url, cached[0]
+
+    estimates = []
+    for infos in jobs:
+        library = infos["Library"]
+        plan = planSearch(infos, countCached, MAX_PAGES[library] * 50)
+        known = all(success for _, success, _ in plan)
+        estimates.append({"Library": library, "Keyword": infos["Keyword"], "SearchWhere": infos["SearchWhere"],
+                          "YearStart": infos["YearStart"], "YearEnd": infos["YearEnd"], "url": getSearchURL(infos),
+                          "searchResultCount": sum(c for _, _, c in plan) if known else None,
+                          "pages": sum(getPageCount(library, c) for _, _, c in plan) if known else None,
+                          "searches": len(plan)})
+
+    cached = [e for e in estimates if e["pages"] is not None]
+    print(f'{len(cached)} of {len(estimates)} searches cached: {sum(e["searchResultCount"] for e in cached)} results '
+          f'on {sum(e["pages"] for e in cached)} pages')
+    return estimates
+
+class CrawlerPool:
+    """
+    Run searches concurrently on a pool of headless drivers, with at most
+    libraryLimits[library] searches per library at the same time. Each
+    thread keeps a warm driver in a DriverManager for the next search.
+    At most workers searches load pages at the same time, a search waiting
+    for a token of its library in politeness gives its slot to another
+    library meanwhile
+
+    Attributes
+    ----------
+    outputFolderBib : str
+        The output folder for the bib files
+    workers : int, optional
+        The maximal number of drivers running at the same time (default is 4)
+    libraryLimits : dict, optional
+        Library to the maximal number of concurrent searches (default is POOL_LIBRARY_LIMITS)
+    headless : bool, optional
+        Passed to setupCrawler (default is True)
+    """
+    def __init__(self, outputFolderBib, workers=4, libraryLimits=None, headless=True):
+        self.outputFolderBib = outputFolderBib
+        self.headless = headless
+        self.libraryLimits = dict(POOL_LIBRARY_LIMITS if libraryLimits is None else libraryLimits)
+        self.running = threading.BoundedSemaphore(workers)
+        self.executors = {}
+        self.drivers = DriverManager()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def crawl(self, infos):
+        library = infos["Library"]
+        key = (library, threading.get_ident())
+        with self.running:
+            crawlSlot.semaphore = self.running
+            try:
+                if ACM_HTTP and library == Library.ACM:
+                    # the HTTP backend needs no browser
+                    return crawlPlanned(None, infos, self.outputFolderBib)
+                driver = self.drivers.get(library, self.outputFolderBib, key=key, headless=self.headless)
+                try:
+                    result = crawlPlanned(driver, infos, self.outputFolderBib)
+                except WebDriverException:
+                    self.drivers.quit(key)
+                    raise
+            finally:
+                crawlSlot.semaphore = None
+        self.drivers.addPages(key, getPageCount(library, result[2]) + 1)
+        return result
+
+    def submit(self, infos):
+        """
+        Queue a search
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to (success, url, searchResultCount) like crawl
+        """
+        library = infos["Library"]
+        with self.lock:
+            if library not in self.executors:
+                # one executor per library, its threads only ever drive that library
+                self.executors[library] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.libraryLimits.get(library, 1), thread_name_prefix=f'crawl-{library.name}')
+            executor = self.executors[library]
+        return executor.submit(self.crawl, infos)
+
+    def map(self, jobs):
+        """
+        Run all jobs and yield (infos, (success, url, searchResultCount)) as they finish,
+        a job that raised yields its exception instead of the tuple
+        """
+        futures = {self.submit(infos): infos for infos in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print_debug(f'Error: Search {futures[future]["Keyword"]} failed: {e}', 0)
+                result = e
+            yield futures[future], result
+
+    def close(self):
+        """
+        Wait for the queued searches and quit all drivers
+        """
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        self.executors = {}
+        self.drivers.close()
+
+#=============================================================
+# Job files: one search per csv row, results are appended to a journal
+# next to the csv and only written back to it by compact
+
+mapLibrary = {"ACM" : Library.ACM,
+              "IEEE" : Library.IEEE,
+              "ScienceDirect" : Library.ScienceDirect}
+
+mapSearchWhere = {"Title" : SearchWhere.Title,
+                  "Abstract" : SearchWhere.Abstract,
+                  "TitleAbstract" : SearchWhere.TitleAbstract,
+                  "Text": SearchWhere.Text}
+
+class JobFile:
+    """
+    A job csv as written by PyLitReview_GenerateJob with the results of its
+    searches. Results go to an append-only journal, one JSON line per
+    search, that is synced on every line, so a crash loses at most the
+    running search. The csv itself is only rewritten by compact
+
+    Attributes
+    ----------
+    fileJob : str
+        The job csv with the columns Library, Key1..KeyN, YearStart, YearEnd,
+        SearchWhere, Done and Url
+    """
+    def __init__(self, fileJob):
+        self.fileJob = fileJob
+        self.journalPath = fileJob + ".journal"
+        with open(fileJob, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            self.header = list(reader.fieldnames)
+            self.rows = list(reader)
+        for column in ["Done", "Url", "Results"]:
+            if column not in self.header:
+                self.header.append(column)
+        self.keyColumns = [c for c in self.header if c.startswith("Key")]
+
+        self.index = {json.dumps(self.getKey(row)): row for row in self.rows}
+        if os.path.isfile(self.journalPath):
+            with open(self.journalPath, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last line of a crashed run may be cut off
+                        continue
+                    row = self.index.get(json.dumps(record["key"]))
+                    if row is not None:
+                        row.update(record["values"])
+        self.journal = None
+
+    def getKey(self, row):
+        """
+        The search of a row as a list, identifies it in the journal
+        """
+        return [row["Library"], [row[c] for c in self.keyColumns], row["SearchWhere"],
+                str(row["YearStart"]), str(row["YearEnd"])]
+
+    def getInfos(self, row):
+        """
+        The infos dict crawl expects for a row
+        """
+        infos = dict(row)
+        infos["Library"] = mapLibrary[row["Library"]]
+        infos["SearchWhere"] = mapSearchWhere[row["SearchWhere"]]
+        infos["YearStart"] = int(row["YearStart"])
+        infos["YearEnd"] = int(row["YearEnd"])
+        infos["Keyword"] = [row[c] for c in self.keyColumns if row[c] not in (None, "")]
+        return infos
+
+    def pending(self):
+        """
+        The rows without Done in the order the notebook crawled them
+        """
+        rows = [row for row in self.rows if (row.get("Done") or "") == ""]
+        return sorted(rows, key=lambda row: (row["Library"], [row[c] for c in self.keyColumns],
+                                             int(row["YearStart"]), int(row["YearEnd"]), row["SearchWhere"]))
+
+    def record(self, row, success, url, searchResultCount):
+        """
+        Append the result of a search to the journal and apply it to the row
+        """
+        values = {"Url": url}
+        if success:
+            values.update({"Done": "True", "Results": str(searchResultCount)})
+        row.update(values)
+        if self.journal is None:
+            self.journal = open(self.journalPath, "a", encoding="utf-8")
+        self.journal.write(json.dumps({"key": self.getKey(row), "values": values, "time": time.time()}) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def compact(self):
+        """
+        Write all results into the csv and start a new journal
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        fd, tmpPath = tempfile.mkstemp(prefix=".", suffix=".csv", dir=os.path.dirname(os.path.abspath(self.fileJob)))
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=self.header, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self.rows)
+        os.replace(tmpPath, self.fileJob)
+        if os.path.isfile(self.journalPath):
+            os.remove(self.journalPath)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+def runJobFile(fileJob, outputFolderBib, workers=None, compact=True):
+    """
+    Crawl all searches of a job csv that are not done yet
+
+    Attributes
+    ----------
+    fileJob : str
+        The job csv
+    outputFolderBib : str
+        The output folder for the bib files
+    workers : int, optional
+        Run the searches on a CrawlerPool with this many drivers, if None
+        one after the other with crawl (default is None)
+    compact : bool, optional
+        Write the results into the csv at the end, else they stay in the
+        journal until JobFile.compact (default is True)
+
+    Returns
+    -------
+    int
+        The number of searches that succeeded
+    int
+        The number of searches run
+    """
+    job = JobFile(fileJob)
+    rows = job.pending()
+    done = 0
+    try:
+        if workers is None:
+            results = ((row, crawl(job.getInfos(row), outputFolderBib)) for row in rows)
+            for row, (success, url, searchResultCount) in tqdm.tqdm(results, total=len(rows), desc="Searches in job"):
+                job.record(row, success, url, searchResultCount)
+                done += success
+        else:
+            with CrawlerPool(outputFolderBib, workers=workers) as pool:
+                jobs = [job.getInfos(row) for row in rows]
+                rowOf = {id(infos): row for infos, row in zip(jobs, rows)}
+                for infos, result in tqdm.tqdm(pool.map(jobs), total=len(rows), desc="Searches in job"):
+                    if isinstance(result, Exception):
+                        continue
+                    success, url, searchResultCount = result
+                    job.record(rowOf[id(infos)], success, url, searchResultCount)
+                    done += success
+    finally:
+        if compact:
+            job.compact()
+        else:
+            job.close()
+    return done, len(rows)
+
+def main(arguments=None):
+    ap = argparse.ArgumentParser(description="pylitreview tools")
+    commands = ap.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="Print latency percentiles per library and step of a trace")
+    summary.add_argument("trace", help="JSON lines written with enableTracing")
+    args = ap.parse_args(arguments)
+
+    if args.command == "summary":
+        summarizeTrace(args.trace)
+
+if __name__ == "__main__":
+    main()
+
+#python pylitreview.py summary trace.jsonl
@@ -0,0 +1,443 @@
+import os
+import io
+import csv
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import contextlib
+
+import unidecode
+from pybtex.database import BibliographyData, Entry, Person, parse_file, parse_string
+from pybtex.scanner import PybtexSyntaxError
+
+import BibFilesMerge as bfm
+import BibFilesMergeBenchmark as bench
+
+#=============================================================
+class TestIterBibEntries(unittest.TestCase):
+    text = b'''Exported 2024-01-01
+@string{chi = "CHI Conference"}
+
+@article(k1, title = "Mail to a@b.c (and back)", author = {Chen, Li}, year = 2020)
+@inproceedings{k2,
+ title = {An @ in braces "quoted" (open},
+ booktitle = chi # " '21",
+ year = {2021}
+}
+@article{k3, title = "A {Braced} word", year = 2020}
+'''
+
+    def test_sameAsParseString(self):
+        entries = list(bfm.iterBibEntries(self.text))
+        reference = parse_string(self.text.decode(), "bibtex")
+        self.assertEqual([entry.key for entry in entries], list(reference.entries))
+        for entry in entries:
+            self.assertEqual(dict(entry.fields), dict(reference.entries[entry.key].fields))
+            self.assertEqual(entry.persons, reference.entries[entry.key].persons)
+
+    def test_chunks(self):
+        chunks = list(bfm.iterBibChunks(self.text))
+        self.assertEqual([line for line, chunk in chunks], [2, 4, 5, 10])
+        self.assertTrue(chunks[1][1].startswith(b'@article(k1'))
+        self.assertTrue(chunks[1][1].rstrip().endswith(b'year = 2020)'))
+
+    def test_errorLineInFile(self):
+        text = b"\n".join(b"@article{a%d, title = {t}, year = 2020}" % i for i in range(5))
+        text = text + b"\n\n\n@article{bad, title = {x} year = 2020\n}\n"
+        with self.assertRaises(PybtexSyntaxError) as context:
+            list(bfm.iterBibEntries(text))
+        with self.assertRaises(PybtexSyntaxError) as reference:
+            parse_string(text.decode(), "bibtex")
+        self.assertEqual(context.exception.lineno, 8)
+        self.assertEqual(context.exception.lineno, reference.exception.lineno)
+
+#=============================================================
+# The normalization as it was before it was computed once per entry
+
+def oldCleanStringToCompare(xStr):
+    return xStr.lower().replace(' ','').replace('.','').replace(',','').replace('-','').replace(':','').replace('/','').replace('\\','').replace("'",'').replace('`','')
+
+def oldFirstAuthorNames(entry):
+    try:
+        lastname = unidecode.unidecode(entry.persons['author'][0].last_names[0]).lower()
+    except :
+        lastname = ""
+    try:
+        firstName = unidecode.unidecode(entry.persons['author'][0].firstNames[0]).lower()
+    except :
+        firstName = ""
+    return lastname, firstName
+
+class TestNormalization(unittest.TestCase):
+    def test_cleanStringToCompare(self):
+        strings = ["", "Virtual Reality: A Survey", "Eye-Tracking in VR/AR, revisited.", "O'Neil's `quoted' \\LaTeX",
+                   "  many   spaces  ", "ÄÖÜ ß İstanbul ΣΑΣ", "10.1145/3411764.3445000", "a--b::c//d\\\\e''f``g,,h..i"]
+        rng = random.Random(0)
+        characters = " .,-:/\\'`\"{}()aZ9äÉıİßΣ_;!?\t\n"
+        strings += ["".join(rng.choice(characters) for _ in range(rng.randint(0, 30))) for _ in range(1000)]
+        for xStr in strings:
+            self.assertEqual(bfm.cleanStringToCompare(xStr), oldCleanStringToCompare(xStr), repr(xStr))
+
+    def test_firstAuthorNames(self):
+        entries = [Entry("article", fields={"title": "No authors"})]
+        for authors in ["Müller, Jörg", "Nguyễn, Ana and Chen, Li", "José García", "Plato", "Ødegaard, Ingrid",
+                        "{\\\"O}zt{\\\"u}rk, Ayşe", "van der Berg, Sarah", ""]:
+            entry = Entry("article")
+            for person in authors.split(" and "):
+                entry.add_person(Person(person), "author")
+            entries.append(entry)
+        entries.append(Entry("article", persons={"editor": [Person("Tanaka, Kenji")]}))
+        for entry in entries:
+            self.assertEqual(bfm.getEntryFirstAuthorNames(entry), oldFirstAuthorNames(entry))
+            if "author" in entry.persons and entry.persons["author"][0].last_names:
+                lastName = entry.persons["author"][0].last_names[0]
+                self.assertEqual(bfm.foldName(lastName), unidecode.unidecode(lastName).lower())
+
+    def test_missingAuthor(self):
+        self.assertEqual(bfm.getEntryFirstAuthorNames(Entry("article")), ("", ""))
+        self.assertEqual(bfm.getEntryKeys(Entry("article", fields={"title": "T"}))[6], ("", ""))
+
+#=============================================================
+# The merge as it was before the lookup index, scanning all accepted entries
+
+def oldRun(folderPath, fileList, fileNameOut):
+    fRemoved = open(os.path.join(folderPath, 'BibFilesMerge_removed.csv'),'w', encoding='utf-8')
+    csvRemoved = csv.writer(fRemoved, delimiter=';', quotechar='"')
+    csvRemoved.writerow(['cause','source','key','doi','author','year','title','publish'])
+    fFinal = open(os.path.join(folderPath, 'BibFilesMerge_final.csv'),'w', encoding='utf-8')
+    csvFinal = csv.writer(fFinal, delimiter=';', quotechar='"')
+    csvFinal.writerow(['key','source','doi','author','year','title','publish','abstract'])
+
+    bibDataOut = BibliographyData()
+    for bibFileName in fileList:
+        bibData = parse_file(os.path.join(folderPath,bibFileName))
+        for entry in bibData.entries.values():
+            doi = bfm.getEntryDOIStr(entry)
+            author = bfm.getEntryAuthorStr(entry)
+            year = bfm.getEntryYearStr(entry)
+            title = bfm.getEntryTitleStr(entry)
+            publish = bfm.getEntryPublishStr(entry)
+
+            if author == '':
+                csvRemoved.writerow(['no author', bibFileName, entry.key, doi, author, year, title, publish])
+            elif year == '':
+                csvRemoved.writerow(['no year', bibFileName, entry.key, doi, author, year, title, publish])
+            elif publish == '':
+                csvRemoved.writerow(['no journal', bibFileName, entry.key, doi, author, year, title, publish])
+            else:
+                key =  entry.key.lower()
+                entry.fields['source'] = bibFileName
+                oldEntry = None
+                cleanTitle = oldCleanStringToCompare(title)
+
+                for entryOut in bibDataOut.entries.values():
+                    if (doi != ''):
+                        doiOut = bfm.getEntryDOIStr(entryOut)
+                        if (doiOut != '' and doi == doiOut):
+                            oldEntry = entryOut
+                            break
+
+                    cleanOutTitle = oldCleanStringToCompare(entryOut.fields['title'])
+                    if (cleanTitle == cleanOutTitle):
+                        year = int(str(entry.fields['year']))
+                        yearOut = int(str(entryOut.fields['year']))
+                        diff = abs(year-yearOut)
+                        if (diff==0):
+                            oldEntry = entryOut
+                        elif (diff==1 or diff==2):
+                            lastname, firstName = oldFirstAuthorNames(entry)
+                            lastNameOut, firstNameOut = oldFirstAuthorNames(entryOut)
+                            if (lastname==lastNameOut or lastname==firstNameOut or lastNameOut==firstName):
+                                oldEntry = entryOut
+                                break
+
+                if (oldEntry != None):
+                    csvRemoved.writerow(['duplicate of next', bibFileName, entry.key, doi, author, year, title, publish])
+                    csvRemoved.writerow(['duplicate of prev', oldEntry.fields['source'], oldEntry.key, bfm.getEntryDOIStr(oldEntry),
+                                         bfm.getEntryAuthorStr(oldEntry), bfm.getEntryYearStr(oldEntry),
+                                         bfm.getEntryTitleStr(oldEntry), bfm.getEntryPublishStr(oldEntry)])
+                    bibDataOut.entries[oldEntry.key] = bfm.mergeEntry(oldEntry, entry)
+                else:
+                    while (key in bibDataOut.entries.keys()):
+                        key = key +"_a"
+                    bibDataOut.entries[key] = entry
+
+    for entry in bibDataOut.entries.values():
+        csvFinal.writerow([entry.key, entry.fields['source'], bfm.getEntryDOIStr(entry), bfm.getEntryAuthorStr(entry),
+                           bfm.getEntryYearStr(entry), bfm.getEntryTitleStr(entry), bfm.getEntryPublishStr(entry),
+                           bfm.getEntryAbstractStr(entry)])
+    bibDataOut.to_file(os.path.join(folderPath, fileNameOut))
+    fRemoved.close()
+    fFinal.close()
+
+class TestReferenceMerge(unittest.TestCase):
+    # two papers exported with the same key, the second is stored as smith2020_a;
+    # its duplicate is then merged into the slot of the first one, so a later
+    # duplicate of the first paper finds nothing to merge with
+    slotOverwrite = [
+        ("slot0.bib", "@article{Smith2020,\n author = {Smith, Anna},\n title = {Foveated rendering for head-mounted displays},\n"
+                      " journal = {IEEE VR},\n year = {2020},\n doi = {10.1109/VR.2020.0001}\n}\n"),
+        ("slot1.bib", "@article{smith2020,\n author = {Smith, Bob},\n title = {Redirected walking in small rooms},\n"
+                      " journal = {CHI},\n year = {2020}\n}\n"),
+        ("slot2.bib", "@inproceedings{bob2021,\n author = {Smith, Bob and Lee, Ann},\n title = {Redirected Walking in Small Rooms},\n"
+                      " booktitle = {CHI '21},\n year = {2021},\n abstract = {A study.}\n}\n"),
+        ("slot3.bib", "@article{anna2020,\n author = {Smith, Anna},\n title = {Foveated Rendering for Head-Mounted Displays},\n"
+                      " journal = {IEEE VR},\n year = {2020},\n doi = {10.1109/VR.2020.0001}\n}\n"),
+    ]
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_BibFilesMerge_")
+        self.fileList = bench.generateCorpus(self.folder, 1500, doiCoverage=0.5, yearJitter=0.3, seed=5)
+        for fileName, text in self.slotOverwrite:
+            with open(os.path.join(self.folder, fileName), "w", encoding="utf-8") as f:
+                f.write(text)
+        self.fileList = self.fileList[:10] + [fileName for fileName, text in self.slotOverwrite] + self.fileList[10:]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def readOutputs(self):
+        outputs = []
+        for fileName in ["out.bib", "BibFilesMerge_removed.csv", "BibFilesMerge_final.csv"]:
+            with open(os.path.join(self.folder, fileName), encoding="utf-8") as f:
+                outputs.append(f.read())
+        return outputs
+
+    def test_sameAsLinearScan(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            oldRun(self.folder, self.fileList, "out.bib")
+        reference = self.readOutputs()
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = bfm.run(self.folder + os.sep, self.fileList, "out.bib", True)
+        self.assertGreater(stats.duplicates, 0)
+        self.assertIn("smith2020_a", reference[0])
+        self.assertNotIn("Foveated rendering", reference[0])
+        self.assertIn("Foveated Rendering", reference[0])
+        for output, referenceOutput in zip(self.readOutputs(), reference):
+            self.assertEqual(output, referenceOutput)
+
+    def test_workers(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            bfm.run(self.folder + os.sep, self.fileList, "out.bib", True, workers=1)
+        reference = self.readOutputs()
+        with contextlib.redirect_stdout(io.StringIO()):
+            bfm.run(self.folder + os.sep, self.fileList, "out.bib", True, workers=3)
+        self.assertEqual(self.readOutputs(), reference)
+        # the second run loads all files from the cache
+        cachePath = os.path.join(self.folder, "cache.sqlite")
+        for i in range(2):
+            with contextlib.redirect_stdout(io.StringIO()):
+                bfm.run(self.folder + os.sep, self.fileList, "out.bib", True, workers=3, cachePath=cachePath)
+            self.assertEqual(self.readOutputs(), reference)
+
+#=============================================================
+class TestMergeStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_BibFilesMerge_")
+        self.fileList = bench.generateCorpus(self.folder, 1000, seed=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def run_(self, fileList, fileNameOut, logProcess=False, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            bfm.run(self.folder + os.sep, fileList, fileNameOut, logProcess, **kwargs)
+        with open(os.path.join(self.folder, fileNameOut), encoding="utf-8") as f:
+            return f.read()
+
+    def readLog(self, fileName):
+        with open(os.path.join(self.folder, fileName), encoding="utf-8") as f:
+            return f.read()
+
+    def test_incrementalOutput(self):
+        storePath = os.path.join(self.folder, "store.sqlite")
+        half = len(self.fileList) // 2
+        self.run_(self.fileList[:half], "first.bib", storePath=storePath)
+        incremental = self.run_(self.fileList, "incremental.bib", storePath=storePath)
+        again = self.run_(self.fileList, "again.bib", storePath=storePath)
+        full = self.run_(self.fileList, "full.bib")
+        self.assertEqual(incremental, full)
+        self.assertEqual(again, full)
+
+    def test_incrementalLogs(self):
+        storePath = os.path.join(self.folder, "store.sqlite")
+        half = len(self.fileList) // 2
+        self.run_(self.fileList, "full.bib", logProcess=True)
+        removed = self.readLog("BibFilesMerge_removed.csv")
+        final = self.readLog("BibFilesMerge_final.csv")
+        self.run_(self.fileList[:half], "first.bib", logProcess=True, storePath=storePath)
+        self.assertNotEqual(self.readLog("BibFilesMerge_removed.csv"), removed)
+        for i in range(2):
+            self.run_(self.fileList, "incremental.bib", logProcess=True, storePath=storePath)
+            self.assertEqual(self.readLog("BibFilesMerge_removed.csv"), removed)
+            self.assertEqual(self.readLog("BibFilesMerge_final.csv"), final)
+
+#=============================================================
+class TestParsedFileCache(unittest.TestCase):
+    text = "@article{k1,\n author = {Chen, Li},\n title = {Gaze typing},\n journal = {CHI},\n year = {2020}\n}\n"
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_BibFilesMerge_")
+        self.cachePath = os.path.join(self.folder, "cache.sqlite")
+        self.filePath = os.path.join(self.folder, "a.bib")
+        self.write(self.text)
+        cache = bfm.ParsedFileCache(self.cachePath)
+        cache.store(self.filePath, bfm.parseBibFile(self.filePath))
+        cache.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, text, mtimeOffset=0):
+        stat = os.stat(self.filePath) if os.path.exists(self.filePath) else None
+        with open(self.filePath, "w", encoding="utf-8") as f:
+            f.write(text)
+        if stat is not None:
+            os.utime(self.filePath, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtimeOffset))
+
+    def load(self):
+        cache = bfm.ParsedFileCache(self.cachePath)
+        try:
+            return cache.load(self.filePath)
+        finally:
+            cache.close()
+
+    def countRows(self):
+        connection = sqlite3.connect(self.cachePath)
+        try:
+            return connection.execute("SELECT COUNT(*) FROM parsed").fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_unchanged(self):
+        entries = self.load()
+        self.assertEqual([(entry.key, keys) for entry, keys in entries],
+                         [(entry.key, keys) for entry, keys in bfm.parseBibFile(self.filePath)])
+
+    def test_sizeChanged(self):
+        self.write(self.text.replace("Gaze typing", "Gaze typing in VR"))
+        self.assertIsNone(self.load())
+
+    def test_contentChanged(self):
+        self.write(self.text.replace("2020", "2021"), 10**9)
+        self.assertIsNone(self.load())
+
+    def test_onlyMtimeChanged(self):
+        self.write(self.text, 10**9)
+        self.assertEqual(self.load()[0][1][3], "Gaze typing")
+        connection = sqlite3.connect(self.cachePath)
+        mtime = connection.execute("SELECT mtime FROM parsed").fetchone()[0]
+        connection.close()
+        self.assertEqual(mtime, os.stat(self.filePath).st_mtime_ns)
+
+    def test_deletedFileEvicted(self):
+        os.remove(self.filePath)
+        bfm.ParsedFileCache(self.cachePath).close()
+        self.assertEqual(self.countRows(), 0)
+
+    def test_versionDrop(self):
+        connection = sqlite3.connect(self.cachePath)
+        connection.execute(f"PRAGMA user_version = {bfm.ParsedFileCache.version - 1}")
+        connection.close()
+        self.assertIsNone(self.load())
+        self.assertEqual(self.countRows(), 0)
+
+#=============================================================
+class TestColumnar(unittest.TestCase):
+    header = ['key', 'year', 'title']
+    rows = [['müller2020', 2020, 'Über Blickinteraktion in VR'],
+            ['nguyen2021', 2021, 'Nguyễn: 視線 & "quotes"; semi'],
+            ['empty', 1999, '']]
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_BibFilesMerge_")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def assertRoundTrip(self, extension):
+        filePath = bfm.writeColumnar(os.path.join(self.folder, "final" + extension), self.header, self.rows)
+        self.assertTrue(filePath.endswith(extension))
+        columns = bfm.readColumnar(filePath)
+        self.assertEqual(list(columns), self.header)
+        self.assertEqual([list(row) for row in zip(*columns.values())], self.rows)
+        self.assertEqual([type(value) for value in columns['year']], [int] * len(self.rows))
+
+    def test_npz(self):
+        self.assertRoundTrip(".npz")
+
+    @unittest.skipUnless(bfm.pyarrow is not None, "pyarrow is not installed")
+    def test_parquet(self):
+        self.assertRoundTrip(".parquet")
+
+    @unittest.skipUnless(bfm.pyarrow is not None, "pyarrow is not installed")
+    def test_arrow(self):
+        self.assertRoundTrip(".arrow")
+
+    def test_sameAsFinalCsv(self):
+        fileList = bench.generateCorpus(self.folder, 500, seed=7)
+        with contextlib.redirect_stdout(io.StringIO()):
+            bfm.run(self.folder + os.sep, fileList, "out.bib", True, columnarOut="final.npz")
+        with open(os.path.join(self.folder, "BibFilesMerge_final.csv"), encoding="utf-8") as f:
+            csvRows = list(csv.reader(f, delimiter=';', quotechar='"'))
+        columns = bfm.readColumnar(os.path.join(self.folder, "final.npz"))
+        self.assertEqual(list(columns), csvRows[0])
+        self.assertEqual([[str(value) for value in row] for row in zip(*columns.values())], csvRows[1:])
+
+#=============================================================
+class TestNearDuplicates(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_BibFilesMerge_")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def merge(self, titleA, titleB, nearDuplicates=True):
+        fileList = []
+        for i, title in enumerate([titleA, titleB]):
+            fileName = f"near{i}.bib"
+            with open(os.path.join(self.folder, fileName), "w", encoding="utf-8") as f:
+                f.write(f"@article{{key{i},\n author = {{Chen, Li and Müller, Jörg}},\n title = {{{title}}},\n"
+                        f" journal = {{Computers \\& Graphics}},\n year = {{2021}}\n}}\n")
+            fileList.append(fileName)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return bfm.run(self.folder + os.sep, fileList, "out.bib", False, nearDuplicates=nearDuplicates)
+
+    def assertMerged(self, titleA, titleB):
+        stats = self.merge(titleA, titleB)
+        self.assertEqual((stats.nearDuplicates, stats.final), (1, 1), (titleA, titleB))
+
+    def assertSeparate(self, titleA, titleB):
+        stats = self.merge(titleA, titleB)
+        self.assertEqual((stats.duplicates, stats.final), (0, 2), (titleA, titleB))
+
+    def test_subtitle(self):
+        self.assertMerged("Gaze-based interaction in virtual reality",
+                          "Gaze-based interaction in virtual reality: a systematic review")
+        self.assertMerged("Haptic feedback for mid-air text entry",
+                          "Haptic feedback for mid-air text entry - results of a user study with 24 participants")
+        stats = self.merge("Gaze-based interaction in virtual reality",
+                           "Gaze-based interaction in virtual reality: a systematic review", nearDuplicates=False)
+        self.assertEqual(stats.final, 2)
+
+    def test_htmlEntity(self):
+        self.assertMerged("Touch &amp; gaze interaction for mobile VR headsets",
+                          "Touch & gaze interaction for mobile VR headsets")
+
+    def test_typo(self):
+        self.assertMerged("Evaluating locomotion techniques in immersive virtual environments",
+                          "Evaluating locomotion techinques in immersive virtual enviroments")
+
+    def test_differentPapers(self):
+        self.assertSeparate("Haptic feedback for virtual reality locomotion",
+                            "Haptic feedback for augmented reality text entry")
+        self.assertSeparate("Gaze interaction in virtual reality",
+                            "Gaze interaction in augmented reality")
+        # a short main title is not compared without its subtitle
+        self.assertSeparate("Virtual reality",
+                            "Virtual reality: rehabilitation after stroke at home")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pybtex.database
+from selenium.common.exceptions import WebDriverException
+
+import pylitreview as plr
+
+fixtureFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testdata", "acm")
+
+#=============================================================
+class SyntheticACMHandler(BaseHTTPRequestHandler):
+    """
+    Answers ACM searches with the search pages in testdata/acm and the
+    citation export with the items of the requested DOIs from export.json.
+    These fixtures are synthetic: the markup follows the ACM result list
+    the parsers read and the papers are made up from the benchmark word
+    lists, they are not captured from dl.acm.org
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, contentType):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "JSESSIONID=synthetic; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parts.query)
+        pagePath = os.path.join(fixtureFolder, f'search_page{query.get("startPage", ["0"])[0]}.html')
+        if parts.path != "/action/doSearch" or not os.path.exists(pagePath):
+            self.send(404, b"", "text/html")
+            return
+        with open(pagePath, "rb") as f:
+            self.send(200, f.read(), "text/html; charset=UTF-8")
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        fields = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        if self.path != "/action/exportCiteProcCitation" or "JSESSIONID=synthetic" not in self.headers.get("Cookie", ""):
+            self.send(403, b"", "text/html")
+            return
+        items = {doi: item for element in self.server.export["items"] for doi, item in element.items()}
+        dois = fields["dois"][0].split(",")
+        body = json.dumps({"items": [{doi: items[doi]} for doi in dois if doi in items]})
+        self.send(200, body.encode(), "application/json")
+
+class TestACMHTTP(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), SyntheticACMHandler)
+        cls.server.connections = set()
+        with open(os.path.join(fixtureFolder, "export.json"), encoding="utf-8") as f:
+            cls.server.export = json.load(f)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_pylitreview_")
+        self.outputFolderBib = os.path.join(self.folder, "bib") + os.sep
+        os.makedirs(self.outputFolderBib)
+        self.resultCountCache = plr.resultCountCache
+        self.politeness = plr.politeness[plr.Library.ACM]
+        plr.resultCountCache = plr.ResultCountCache(os.path.join(self.folder, "resultcounts.sqlite"))
+        plr.politeness[plr.Library.ACM] = plr.TokenBucket(1e6, burst=100)
+        self.infos = {"Library": plr.Library.ACM, "Keyword": ["virtual reality", "haptic"],
+                      "SearchWhere": plr.SearchWhere.TitleAbstract, "YearStart": 2020, "YearEnd": 2021}
+
+    def tearDown(self):
+        plr.resultCountCache.connection.close()
+        plr.resultCountCache = self.resultCountCache
+        plr.politeness[plr.Library.ACM] = self.politeness
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_saveACMBibHTTP(self):
+        self.server.connections.clear()
+        with plr.HTTPSession(baseURL=f"http://127.0.0.1:{self.server.server_port}") as session:
+            success, url, searchResultCount = plr.saveACMBibHTTP(self.infos, self.outputFolderBib, session)
+        self.assertTrue(success)
+        self.assertEqual(searchResultCount, 53)
+        self.assertEqual(len(self.server.connections), 1)
+
+        entries = {}
+        for page, count in enumerate([50, 3]):
+            filePath = plr.getFileNameOutput(self.infos, self.outputFolderBib, page)
+            bib = pybtex.database.parse_file(filePath, bib_format="bibtex")
+            self.assertEqual(len(bib.entries), count)
+            entries.update(bib.entries)
+
+        exported = [doi for element in self.server.export["items"] for doi in element]
+        self.assertEqual(list(entries), exported)
+        first = entries[exported[0]]
+        self.assertEqual(first.fields["year"], "2021")
+        self.assertEqual(first.fields["doi"], exported[0])
+        self.assertTrue(first.fields["booktitle"].startswith("Proceedings of the 2021 CHI"))
+
+    def test_saveACMBibHTTPResume(self):
+        baseURL = f"http://127.0.0.1:{self.server.server_port}"
+        with plr.HTTPSession(baseURL=baseURL) as session:
+            self.assertTrue(plr.saveACMBibHTTP(self.infos, self.outputFolderBib, session)[0])
+        os.remove(plr.getFileNameOutput(self.infos, self.outputFolderBib, 1))
+        with plr.HTTPSession(baseURL=baseURL) as session:
+            self.assertTrue(plr.saveACMBibHTTP(self.infos, self.outputFolderBib, session)[0])
+        self.assertTrue(plr.isBibFileComplete(plr.getFileNameOutput(self.infos, self.outputFolderBib, 1)))
+
+class TestCslToBibtex(unittest.TestCase):
+    def parse(self, title):
+        text = plr.cslToBibtex("10.1145/1.2", {"type": "PAPER_CONFERENCE", "title": title})
+        return pybtex.database.parse_string(text, "bibtex").entries["10.1145/1.2"]
+
+    def test_unbalancedBraces(self):
+        self.assertEqual(self.parse("A {weird title").fields["title"], "A \\textbraceleft{}weird title")
+        self.assertEqual(self.parse("A weird} title").fields["title"], "A weird\\textbraceright{} title")
+
+    def test_backslash(self):
+        self.assertEqual(self.parse("back\\slash").fields["title"], "back\\textbackslash{}slash")
+
+    def test_authors(self):
+        text = plr.cslToBibtex("10.1145/1.2", {"type": "ARTICLE", "title": "T",
+                                               "author": [{"family": "Müller", "given": "Jörg"}, {"family": "Chen"}]})
+        entry = pybtex.database.parse_string(text, "bibtex").entries["10.1145/1.2"]
+        self.assertEqual(entry.type, "article")
+        self.assertEqual([str(person) for person in entry.persons["author"]], ["Müller, Jörg", "Chen"])
+
+#=============================================================
+class StubDriver:
+    """
+    Stands in for a Chrome driver, after crash() every command fails like
+    on a session whose browser is gone
+    """
+    def __init__(self):
+        self.crashed = False
+        self.quitted = False
+
+    def crash(self):
+        self.crashed = True
+
+    @property
+    def window_handles(self):
+        if self.crashed:
+            raise WebDriverException("chrome not reachable")
+        return ["main"]
+
+    def quit(self):
+        self.quitted = True
+        if self.crashed:
+            raise WebDriverException("chrome not reachable")
+
+class TestDriverManager(unittest.TestCase):
+    def setUp(self):
+        self.drivers = []
+        self.setupCrawler = plr.setupCrawler
+        self.crawlPlanned = plr.crawlPlanned
+        self.driverManager = plr.driverManager
+        plr.setupCrawler = self.newDriver
+        plr.driverManager = plr.DriverManager(maxRSS=None)
+        self.folder = tempfile.mkdtemp(prefix="test_pylitreview_")
+        self.infos = {"Library": plr.Library.IEEE, "Keyword": ["haptic"],
+                      "SearchWhere": plr.SearchWhere.TitleAbstract, "YearStart": 2020, "YearEnd": 2021}
+
+    def tearDown(self):
+        plr.driverManager.close()
+        plr.setupCrawler = self.setupCrawler
+        plr.crawlPlanned = self.crawlPlanned
+        plr.driverManager = self.driverManager
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def newDriver(self, library, outputFolderBib, headless=True):
+        self.drivers.append(StubDriver())
+        return self.drivers[-1]
+
+    def test_reuseAndRecycle(self):
+        manager = plr.DriverManager(maxPages=10, maxRSS=None)
+        driver = manager.get(plr.Library.IEEE, self.folder)
+        self.assertIs(manager.get(plr.Library.IEEE, self.folder), driver)
+        manager.addPages(plr.Library.IEEE, 10)
+        self.assertIsNot(manager.get(plr.Library.IEEE, self.folder), driver)
+        self.assertTrue(driver.quitted)
+        manager.close()
+
+    def test_crashedBrowserIsReplaced(self):
+        manager = plr.DriverManager(maxRSS=None)
+        driver = manager.get(plr.Library.IEEE, self.folder)
+        driver.crash()
+        replacement = manager.get(plr.Library.IEEE, self.folder)
+        self.assertIsNot(replacement, driver)
+        self.assertTrue(driver.quitted)
+        self.assertIs(manager.get(plr.Library.IEEE, self.folder), replacement)
+        manager.close()
+
+    def test_crawlDropsDriverAfterWebDriverException(self):
+        def crashingCrawl(driver, infos, outputFolderBib):
+            driver.crash()
+            raise WebDriverException("chrome not reachable")
+        plr.crawlPlanned = crashingCrawl
+        with self.assertRaises(WebDriverException):
+            plr.crawl(self.infos, self.folder)
+        self.assertTrue(self.drivers[0].quitted)
+        self.assertNotIn(plr.Library.IEEE, plr.driverManager.drivers)
+
+        plr.crawlPlanned = lambda driver, infos, outputFolderBib: (True, "url", 0)
+        self.assertEqual(plr.crawl(self.infos, self.folder), (True, "url", 0))
+        self.assertEqual(len(self.drivers), 2)
+
+    def test_poolDropsDriverAfterWebDriverException(self):
+        def crashingCrawl(driver, infos, outputFolderBib):
+            driver.crash()
+            raise WebDriverException("chrome not reachable")
+        plr.crawlPlanned = crashingCrawl
+        with plr.CrawlerPool(self.folder, workers=1) as pool:
+            with self.assertRaises(WebDriverException):
+                pool.submit(self.infos).result()
+            self.assertEqual(pool.drivers.drivers, {})
+            plr.crawlPlanned = lambda driver, infos, outputFolderBib: (True, "url", 0)
+            self.assertEqual(pool.submit(self.infos).result(), (True, "url", 0))
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(all(driver.quitted for driver in self.drivers))
+
+    def test_poolStartsNoDriverForACMHTTP(self):
+        drivers = []
+        def planned(driver, infos, outputFolderBib):
+            drivers.append(driver)
+            return True, "url", 0
+        plr.crawlPlanned = planned
+        acmHTTP = plr.ACM_HTTP
+        plr.ACM_HTTP = True
+        try:
+            with plr.CrawlerPool(self.folder, workers=2) as pool:
+                infos = dict(self.infos, Library=plr.Library.ACM)
+                results = [result for _, result in pool.map([infos, infos, infos])]
+        finally:
+            plr.ACM_HTTP = acmHTTP
+        self.assertEqual(results, [(True, "url", 0)] * 3)
+        self.assertEqual(drivers, [None] * 3)
+        self.assertEqual(self.drivers, [])
+
+    def test_tokenWaitFreesWorkerSlot(self):
+        finished = {}
+        def planned(driver, infos, outputFolderBib):
+            for _ in range(3):
+                plr.politeness[infos["Library"]].wait()
+            finished[infos["Library"]] = time.monotonic()
+            return True, "url", 0
+        plr.crawlPlanned = planned
+        politeness = dict(plr.politeness)
+        plr.politeness[plr.Library.IEEE] = plr.TokenBucket(200, burst=1)
+        plr.politeness[plr.Library.ScienceDirect] = plr.TokenBucket(1e6, burst=100)
+        try:
+            with plr.CrawlerPool(self.folder, workers=1) as pool:
+                ieee = pool.submit(self.infos)
+                time.sleep(0.1)
+                scienceDirect = pool.submit(dict(self.infos, Library=plr.Library.ScienceDirect))
+                self.assertEqual(scienceDirect.result(), (True, "url", 0))
+                self.assertEqual(ieee.result(), (True, "url", 0))
+        finally:
+            plr.politeness.update(politeness)
+        # IEEE waits 0.3s per token, ScienceDirect ran in between
+        self.assertLess(finished[plr.Library.ScienceDirect], finished[plr.Library.IEEE])
+
+if __name__ == "__main__":
+    unittest.main()